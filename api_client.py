@@ -0,0 +1,260 @@
+import random
+import threading
+import time
+from typing import Dict
+
+from config import (
+    OPENAI_API_KEY,
+    OPENAI_API_BASE,
+    EMBEDDING_RPM_LIMIT,
+    EMBEDDING_TPM_LIMIT,
+    CHAT_RPM_LIMIT,
+    CHAT_TPM_LIMIT,
+    API_INITIAL_CONCURRENCY,
+    API_MAX_CONCURRENCY,
+    API_MAX_RETRIES,
+    API_BACKOFF_BASE,
+    API_BACKOFF_MAX,
+)
+# openai SDK导入较慢，延迟到首次创建客户端时导入
+from startup_profile import timed_import
+
+
+def _retryable_errors() -> tuple:
+    """可重试的错误：限流(429)、连接/超时、服务端5xx"""
+    openai = timed_import("openai")
+    return (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+
+class TokenBucket:
+    """令牌桶：容量为每分钟配额，按秒匀速补充"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """取出amount个令牌，不足时阻塞等待，返回等待的秒数"""
+        # 单次请求超过桶容量时按容量计，避免永远等待
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def adjust(self, amount: float) -> None:
+        """按实际用量修正预估值：正数补扣，负数退还"""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class AIMDLimiter:
+    """加性增、乘性减(AIMD)的自适应并发控制
+
+    每个成功请求使并发上限增加 1/上限（约每轮增加1），遇到限流时上限减半
+    """
+
+    def __init__(self, initial: int = API_INITIAL_CONCURRENCY, maximum: int = API_MAX_CONCURRENCY):
+        self.limit = float(initial)
+        self.maximum = maximum
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    def acquire(self) -> None:
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self) -> None:
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def on_success(self) -> None:
+        with self.condition:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self.condition.notify_all()
+
+    def on_throttle(self) -> None:
+        with self.condition:
+            self.limit = max(1.0, self.limit / 2)
+
+
+class _Endpoint:
+    """单个API端点（embedding或chat）的限流、并发控制、重试与统计"""
+
+    def __init__(self, name: str, rpm: int, tpm: int):
+        self.name = name
+        self.request_bucket = TokenBucket(rpm)
+        self.token_bucket = TokenBucket(tpm)
+        self.limiter = AIMDLimiter()
+        self.metrics_lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "successes": 0,
+            "failures": 0,
+            "retries": 0,
+            "throttled": 0,
+            "tokens": 0,
+            "rate_limit_wait": 0.0,
+            "latency_total": 0.0,
+        }
+
+    def _record(self, **deltas) -> None:
+        with self.metrics_lock:
+            for key, value in deltas.items():
+                self.stats[key] += value
+
+    def call(self, func, estimated_tokens: int, **kwargs):
+        retryable_errors = _retryable_errors()
+        rate_limit_error = retryable_errors[0]
+        for attempt in range(API_MAX_RETRIES + 1):
+            waited = self.request_bucket.acquire(1)
+            waited += self.token_bucket.acquire(estimated_tokens)
+            self.limiter.acquire()
+            start = time.monotonic()
+            try:
+                self._record(requests=1, rate_limit_wait=waited)
+                response = func(**kwargs)
+            except retryable_errors as e:
+                # 失败的请求未消耗配额，退还预扣的token，避免连续429耗尽TPM令牌桶
+                self.token_bucket.adjust(-estimated_tokens)
+                throttled = isinstance(e, rate_limit_error)
+                if throttled:
+                    self.limiter.on_throttle()
+                self._record(throttled=int(throttled))
+                if attempt == API_MAX_RETRIES:
+                    self._record(failures=1)
+                    raise
+                self._record(retries=1)
+                time.sleep(self._backoff(attempt, e))
+                continue
+            except Exception:
+                self.token_bucket.adjust(-estimated_tokens)
+                self._record(failures=1)
+                raise
+            finally:
+                self.limiter.release()
+
+            self.limiter.on_success()
+            usage = getattr(response, "usage", None)
+            used = getattr(usage, "total_tokens", None) or estimated_tokens
+            self.token_bucket.adjust(used - estimated_tokens)
+            self._record(successes=1, tokens=used, latency_total=time.monotonic() - start)
+            return response
+
+    @staticmethod
+    def _backoff(attempt: int, error: Exception) -> float:
+        """指数退避加全抖动；服务端给出Retry-After时优先采用，并限制在[0, API_BACKOFF_MAX]内"""
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(API_BACKOFF_MAX, max(0.0, float(retry_after)))
+            except ValueError:
+                pass
+        return random.uniform(0, min(API_BACKOFF_MAX, API_BACKOFF_BASE * (2 ** attempt)))
+
+    def metrics(self) -> Dict:
+        with self.metrics_lock:
+            metrics = dict(self.stats)
+        metrics["concurrency_limit"] = int(self.limiter.limit)
+        metrics["in_flight"] = self.limiter.in_flight
+        metrics["avg_latency"] = (
+            metrics["latency_total"] / metrics["successes"] if metrics["successes"] else 0.0
+        )
+        return metrics
+
+
+def _estimate_tokens(text: str) -> int:
+    """粗略估计token数：中文约1字1token，英文约4字符1token，这里按字符数保守估计"""
+    return max(1, len(text))
+
+
+class _Embeddings:
+    def __init__(self, client, endpoint: _Endpoint):
+        self._client = client
+        self._endpoint = endpoint
+
+    def create(self, **kwargs):
+        inputs = kwargs.get("input", "")
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        estimated = sum(_estimate_tokens(text) for text in inputs)
+        return self._endpoint.call(self._client.embeddings.create, estimated, **kwargs)
+
+
+class _Completions:
+    def __init__(self, client, endpoint: _Endpoint):
+        self._client = client
+        self._endpoint = endpoint
+
+    def create(self, **kwargs):
+        prompt_tokens = 0
+        for message in kwargs.get("messages", []):
+            content = message.get("content", "")
+            if isinstance(content, list):
+                content = "".join(part.get("text", "") for part in content)
+            prompt_tokens += _estimate_tokens(content)
+        estimated = prompt_tokens + kwargs.get("max_tokens", 0)
+        return self._endpoint.call(self._client.chat.completions.create, estimated, **kwargs)
+
+
+class _Chat:
+    def __init__(self, completions: _Completions):
+        self.completions = completions
+
+
+class RateLimitedClient:
+    """带限流、自适应并发与重试的OpenAI客户端
+
+    接口与OpenAI客户端一致（client.embeddings.create / client.chat.completions.create），
+    可直接替换VectorStore与RAGAgent中的self.client
+    """
+
+    def __init__(self, api_key: str = OPENAI_API_KEY, api_base: str = OPENAI_API_BASE):
+        # 重试由本层统一负责，关闭SDK自带的重试
+        self._client = timed_import("openai").OpenAI(api_key=api_key, base_url=api_base, max_retries=0)
+        self._embedding_endpoint = _Endpoint("embeddings", EMBEDDING_RPM_LIMIT, EMBEDDING_TPM_LIMIT)
+        self._chat_endpoint = _Endpoint("chat", CHAT_RPM_LIMIT, CHAT_TPM_LIMIT)
+
+        self.embeddings = _Embeddings(self._client, self._embedding_endpoint)
+        self.chat = _Chat(_Completions(self._client, self._chat_endpoint))
+
+    def metrics(self) -> Dict[str, Dict]:
+        """返回各端点的请求数、重试、限流次数、token用量、等待时间、当前并发上限等统计"""
+        return {
+            endpoint.name: endpoint.metrics()
+            for endpoint in (self._embedding_endpoint, self._chat_endpoint)
+        }
+
+
+_shared_clients: Dict[tuple, RateLimitedClient] = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_client(
+    api_key: str = OPENAI_API_KEY, api_base: str = OPENAI_API_BASE
+) -> RateLimitedClient:
+    """获取进程内共享的客户端，相同API key与地址共用同一组限流配额"""
+    key = (api_key, api_base)
+    with _shared_lock:
+        if key not in _shared_clients:
+            _shared_clients[key] = RateLimitedClient(api_key=api_key, api_base=api_base)
+        return _shared_clients[key]
@@ -0,0 +1,298 @@
+import hashlib
+import json
+import math
+import os
+import sys
+from array import array
+from typing import List, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from startup_profile import timed_import
+
+# 上次压实后新增的文档块超过已压实部分的这一比例（且不少于下限）时重新压实
+_COMPACT_DELTA_RATIO = 0.1
+_COMPACT_MIN_DOCS = 1000
+# 已删除文档块的占比超过该值时压实，回收空间
+_COMPACT_DEAD_RATIO = 0.25
+_DIGEST_SIZE = 20
+
+
+def _view(buffer, dtype) -> np.ndarray:
+    """array的零拷贝NumPy视图，只在函数内临时使用，否则原数组无法再扩容"""
+    if not len(buffer):
+        return np.zeros(0, dtype=dtype)
+    return np.frombuffer(buffer, dtype=dtype)
+
+
+class BM25Index:
+    """支持增量更新的BM25(Okapi)倒排索引，以列式数组紧凑存储
+
+    词项字符串只保存一份，其余位置均用int32词项编号；倒排表是NumPy CSR数组
+    （indptr / 文档位置 / 词频），上次压实后加入的文档块记在一个小的增量倒排中。
+    每个文档块的正排（词项编号与词频）按内容哈希复用，内容未变的文档块重新加入时不再调用jieba。
+    删除只把文档块标记为失效，文档频率与平均长度按存活的文档块计算；
+    增量或失效的文档块过多时自动压实，代价按语料增长摊销。
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._terms: Dict[str, int] = {}
+        self._term_list: List[str] = []
+
+        # 以下按文档块位置存储
+        self._doc_ids: List[str] = []
+        self._positions: Dict[str, int] = {}  # 存活文档块的id -> 位置
+        self._doc_len = array("i")
+        self._alive = array("b")
+        self._doc_hash = bytearray()  # 每个文档块20字节的sha1
+        self._hash_positions: Dict[bytes, int] = {}
+
+        # 正排：第i个文档块的词项为 _fwd_terms[_fwd_offsets[i]:_fwd_offsets[i + 1]]
+        self._fwd_offsets = array("q", [0])
+        self._fwd_terms = array("i")
+        self._fwd_tfs = array("i")
+
+        # 已压实部分的倒排（CSR）及之后加入的文档块的增量倒排
+        self._inv_indptr = np.zeros(1, dtype=np.int64)
+        self._inv_docs = np.zeros(0, dtype=np.int32)
+        self._inv_tfs = np.zeros(0, dtype=np.int32)
+        self._compacted = 0
+        self._delta: Dict[int, Tuple[array, array]] = {}
+
+        self.total_len = 0
+        self._seed: Optional["BM25Index"] = None
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._positions
+
+    @property
+    def avgdl(self) -> float:
+        return self.total_len / len(self._positions) if self._positions else 0.0
+
+    def seed(self, other: Optional["BM25Index"]) -> None:
+        """以另一个索引的正排作为分词缓存，内容相同的文档块无需重新分词；传入None时释放"""
+        self._seed = other
+
+    def _intern(self, term: str) -> int:
+        term_id = self._terms.get(term)
+        if term_id is None:
+            term_id = len(self._term_list)
+            self._terms[term] = term_id
+            self._term_list.append(term)
+        return term_id
+
+    def _forward(self, position: int) -> Tuple[array, array]:
+        start, end = self._fwd_offsets[position], self._fwd_offsets[position + 1]
+        return self._fwd_terms[start:end], self._fwd_tfs[start:end]
+
+    def _term_freqs(self, content: str, digest: bytes) -> Dict[int, int]:
+        """文档块的 {词项编号: 词频}，相同内容已有正排时直接复用"""
+        position = self._hash_positions.get(digest)
+        if position is not None:
+            return dict(zip(*self._forward(position)))
+
+        seed = self._seed
+        if seed is not None and digest in seed._hash_positions:
+            terms, tfs = seed._forward(seed._hash_positions[digest])
+            return {self._intern(seed._term_list[t]): tf for t, tf in zip(terms, tfs)}
+
+        term_freqs: Dict[int, int] = {}
+        for token in timed_import("jieba").lcut(content):
+            term_id = self._intern(token)
+            term_freqs[term_id] = term_freqs.get(term_id, 0) + 1
+        return term_freqs
+
+    def add(self, docs: Iterable[Dict]) -> None:
+        """加入文档块（需包含id与content），id已存在时替换原内容"""
+        for doc in docs:
+            doc_id = doc["id"]
+            if doc_id in self._positions:
+                self.remove([doc_id])
+
+            content = doc.get("content") or ""
+            digest = hashlib.sha1(content.encode("utf-8")).digest()
+            term_freqs = self._term_freqs(content, digest)
+
+            position = len(self._doc_ids)
+            length = sum(term_freqs.values())
+            self._doc_ids.append(doc_id)
+            self._positions[doc_id] = position
+            self._doc_len.append(length)
+            self._alive.append(1)
+            self._doc_hash.extend(digest)
+            self._hash_positions[digest] = position
+
+            for term_id in sorted(term_freqs):
+                tf = term_freqs[term_id]
+                self._fwd_terms.append(term_id)
+                self._fwd_tfs.append(tf)
+                positions, tfs = self._delta.setdefault(term_id, (array("i"), array("i")))
+                positions.append(position)
+                tfs.append(tf)
+            self._fwd_offsets.append(len(self._fwd_terms))
+            self.total_len += length
+
+        pending = len(self._doc_ids) - self._compacted
+        if pending > max(_COMPACT_MIN_DOCS, _COMPACT_DELTA_RATIO * self._compacted):
+            self.compact()
+
+    def remove(self, ids: Iterable[str]) -> None:
+        """移除文档块，不存在的id忽略"""
+        for doc_id in ids:
+            position = self._positions.pop(doc_id, None)
+            if position is None:
+                continue
+            self._alive[position] = 0
+            self.total_len -= self._doc_len[position]
+
+        dead = len(self._doc_ids) - len(self._positions)
+        if dead > _COMPACT_MIN_DOCS and dead > _COMPACT_DEAD_RATIO * len(self._doc_ids):
+            self.compact()
+
+    def compact(self) -> None:
+        """丢弃已删除的文档块与不再出现的词项，把全部倒排重建为CSR数组
+
+        种子索引（seed）不受影响，构建期间的自动压实之后仍可复用其分词结果
+        """
+        alive = _view(self._alive, np.int8).astype(bool)
+        lengths = np.diff(_view(self._fwd_offsets, np.int64))
+        keep = np.repeat(alive, lengths)
+        fwd_tfs = _view(self._fwd_tfs, np.int32)[keep]
+        lengths = lengths[alive]
+
+        # 词项重新编号；每个文档块内的词项编号仍保持升序
+        used, fwd_terms = np.unique(_view(self._fwd_terms, np.int32)[keep], return_inverse=True)
+        fwd_terms = fwd_terms.reshape(-1).astype(np.int32)
+        self._term_list = [self._term_list[t] for t in used.tolist()]
+        self._terms = {term: i for i, term in enumerate(self._term_list)}
+
+        self._doc_ids = [self._doc_ids[p] for p in np.flatnonzero(alive).tolist()]
+        self._positions = {doc_id: i for i, doc_id in enumerate(self._doc_ids)}
+        self._doc_len = array("i", _view(self._doc_len, np.int32)[alive].tobytes())
+        self._alive = array("b", b"\x01" * len(self._doc_ids))
+        digests = np.frombuffer(bytes(self._doc_hash), dtype=np.uint8).reshape(-1, _DIGEST_SIZE)[alive]
+        self._doc_hash = bytearray(digests.tobytes())
+        self._hash_positions = {bytes(digest): i for i, digest in enumerate(digests)}
+
+        self._fwd_offsets = array("q", np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64).tobytes())
+        self._fwd_terms = array("i", fwd_terms.tobytes())
+        self._fwd_tfs = array("i", fwd_tfs.tobytes())
+
+        order = np.argsort(fwd_terms, kind="stable")
+        self._inv_docs = np.repeat(np.arange(len(self._doc_ids), dtype=np.int32), lengths)[order]
+        self._inv_tfs = fwd_tfs[order]
+        counts = np.bincount(fwd_terms, minlength=len(self._term_list))
+        self._inv_indptr = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self._compacted = len(self._doc_ids)
+        self._delta = {}
+
+    def _postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """词项在存活文档块中的 (位置, 词频)"""
+        term_id = self._terms.get(term)
+        positions, tfs = [], []
+        if term_id is not None and term_id + 1 < len(self._inv_indptr):
+            start, end = self._inv_indptr[term_id], self._inv_indptr[term_id + 1]
+            positions.append(self._inv_docs[start:end])
+            tfs.append(self._inv_tfs[start:end])
+        if term_id in self._delta:
+            delta_positions, delta_tfs = self._delta[term_id]
+            positions.append(np.array(delta_positions, dtype=np.int32))
+            tfs.append(np.array(delta_tfs, dtype=np.int32))
+        if not positions:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+
+        positions = np.concatenate(positions)
+        tfs = np.concatenate(tfs)
+        alive = _view(self._alive, np.int8)[positions] > 0
+        return positions[alive], tfs[alive]
+
+    def _idf(self, df: int) -> float:
+        # 使用恒为正的平滑idf，避免Okapi原始公式对高频词给出负值后需按全体词项平均修正
+        n = len(self._positions)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def idf(self, term: str) -> float:
+        return self._idf(len(self._postings(term)[0]))
+
+    def term_scores(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """单个词项对包含它的各文档块贡献的得分，返回 (文档块位置, 得分)"""
+        positions, tfs = self._postings(term)
+        if not len(positions):
+            return positions, np.zeros(0)
+        doc_len = _view(self._doc_len, np.int32)[positions]
+        norm = self.k1 * (1 - self.b + self.b * doc_len / self.avgdl)
+        return positions, self._idf(len(positions)) * tfs * (self.k1 + 1) / (tfs + norm)
+
+    def get_scores(self, query_tokens: List[str]) -> np.ndarray:
+        """计算查询对各位置文档块的得分，已删除的位置得分为0"""
+        scores = np.zeros(len(self._doc_ids))
+        for token in query_tokens:
+            positions, term_scores = self.term_scores(token)
+            scores[positions] += term_scores
+        return scores
+
+    def top_k(self, scores: np.ndarray, k: int) -> List[Tuple[str, float]]:
+        """取得分大于0的前k个文档块，返回 [(文档id, 得分)]"""
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(self._doc_ids[p], float(scores[p])) for p in candidates.tolist()]
+
+    def memory_bytes(self) -> int:
+        """索引占用的内存：数组按实际字节数，字符串与字典按sys.getsizeof计算"""
+        arrays = sum(
+            buffer.itemsize * len(buffer)
+            for buffer in (self._doc_len, self._alive, self._fwd_offsets, self._fwd_terms, self._fwd_tfs)
+        )
+        arrays += len(self._doc_hash) + self._inv_indptr.nbytes + self._inv_docs.nbytes + self._inv_tfs.nbytes
+        arrays += sum(8 * len(positions) for positions, _ in self._delta.values())
+        strings = sum(map(sys.getsizeof, self._term_list)) + sum(map(sys.getsizeof, self._doc_ids))
+        dicts = sum(map(sys.getsizeof, (self._terms, self._positions, self._hash_positions, self._delta)))
+        return arrays + strings + dicts
+
+    def save(self, path: str) -> None:
+        """压实后保存为npz，词项与文档id以JSON字节串存放"""
+        self.compact()
+        with open(path, "wb") as f:
+            np.savez_compressed(
+                f,
+                version=np.array([2]),
+                params=np.array([self.k1, self.b]),
+                terms=np.frombuffer(json.dumps(self._term_list, ensure_ascii=False).encode("utf-8"), dtype=np.uint8),
+                doc_ids=np.frombuffer(json.dumps(self._doc_ids, ensure_ascii=False).encode("utf-8"), dtype=np.uint8),
+                doc_len=_view(self._doc_len, np.int32),
+                doc_hash=np.frombuffer(bytes(self._doc_hash), dtype=np.uint8),
+                fwd_offsets=_view(self._fwd_offsets, np.int64),
+                fwd_terms=_view(self._fwd_terms, np.int32),
+                fwd_tfs=_view(self._fwd_tfs, np.int32),
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path, allow_pickle=False) as data:
+            k1, b = data["params"].tolist()
+            index = cls(k1=k1, b=b)
+            index._term_list = json.loads(data["terms"].tobytes().decode("utf-8"))
+            index._doc_ids = json.loads(data["doc_ids"].tobytes().decode("utf-8"))
+            index._doc_len = array("i", data["doc_len"].astype(np.int32).tobytes())
+            index._doc_hash = bytearray(data["doc_hash"].tobytes())
+            index._fwd_offsets = array("q", data["fwd_offsets"].astype(np.int64).tobytes())
+            index._fwd_terms = array("i", data["fwd_terms"].astype(np.int32).tobytes())
+            index._fwd_tfs = array("i", data["fwd_tfs"].astype(np.int32).tobytes())
+        index._alive = array("b", b"\x01" * len(index._doc_ids))
+        index._positions = {doc_id: i for i, doc_id in enumerate(index._doc_ids)}
+        index.total_len = sum(index._doc_len)
+        # 由正排重建倒排、词项表与内容哈希索引
+        index.compact()
+        return index
+
+
+def bm25_index_path(db_path: str, collection_name: str) -> str:
+    """持久化BM25索引的位置，与向量数据库放在一起"""
+    return os.path.join(db_path, f"{collection_name}.bm25.npz")
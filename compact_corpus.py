@@ -0,0 +1,152 @@
+import sys
+from array import array
+from typing import Any, Dict, Iterable, List, Optional
+
+# 已删除文档块的占比超过该值（且数量不少于下限）时压实内容缓冲区
+_COMPACT_DEAD_RATIO = 0.25
+_COMPACT_MIN_DOCS = 1000
+
+
+def _intern_key(value: Any) -> tuple:
+    # 连同类型一起驻留，避免True与1、1与1.0被视为同一取值
+    return type(value).__name__, tuple(value) if isinstance(value, list) else value
+
+
+class CompactCorpus:
+    """文档块的列式紧凑存储
+
+    所有内容以UTF-8连续存放在一个bytearray中，按偏移和长度定位；
+    元数据按字段分列，取值经驻留后只存一份，每个文档块只记一个int32编码（-1表示缺失）。
+    只在get时为单个文档块还原出dict，供检索的最终top_k使用。
+    """
+
+    def __init__(self):
+        self._content = bytearray()
+        self._starts = array("q")
+        self._lengths = array("i")
+        self._ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._alive = array("b")
+        # 字段名 -> (取值表, 取值 -> 编码, 各文档块的编码)
+        self._fields: Dict[str, tuple] = {}
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._positions
+
+    def _field(self, name: str) -> tuple:
+        field = self._fields.get(name)
+        if field is None:
+            field = ([], {}, array("i", [-1]) * len(self._ids))
+            self._fields[name] = field
+        return field
+
+    def add(self, docs: Iterable[Dict]) -> None:
+        """加入文档块（需包含id），id已存在时替换原内容"""
+        for doc in docs:
+            doc_id = doc["id"]
+            if doc_id in self._positions:
+                self.remove([doc_id])
+
+            content = (doc.get("content") or "").encode("utf-8")
+            self._starts.append(len(self._content))
+            self._lengths.append(len(content))
+            self._content.extend(content)
+
+            metadata = doc.get("metadata") or {}
+            for name in metadata:
+                self._field(name)
+            for name, (values, codes, column) in self._fields.items():
+                if name not in metadata:
+                    column.append(-1)
+                    continue
+                key = _intern_key(metadata[name])
+                code = codes.get(key)
+                if code is None:
+                    code = len(values)
+                    codes[key] = code
+                    values.append(metadata[name])
+                column.append(code)
+
+            self._positions[doc_id] = len(self._ids)
+            self._ids.append(doc_id)
+            self._alive.append(1)
+
+    def remove(self, ids: Iterable[str]) -> None:
+        """移除文档块，不存在的id忽略"""
+        for doc_id in ids:
+            position = self._positions.pop(doc_id, None)
+            if position is not None:
+                self._alive[position] = 0
+
+        dead = len(self._ids) - len(self._positions)
+        if dead > _COMPACT_MIN_DOCS and dead > _COMPACT_DEAD_RATIO * len(self._ids):
+            self.compact()
+
+    def compact(self) -> None:
+        """丢弃已删除文档块的内容与不再使用的元数据取值"""
+        keep = [p for p in range(len(self._ids)) if self._alive[p]]
+        content = bytearray()
+        starts, lengths = array("q"), array("i")
+        for p in keep:
+            start, length = self._starts[p], self._lengths[p]
+            starts.append(len(content))
+            lengths.append(length)
+            content.extend(self._content[start:start + length])
+
+        fields = {}
+        for name, (values, _, column) in self._fields.items():
+            new_values, new_codes, new_column = [], {}, array("i")
+            remap = {}
+            for p in keep:
+                code = column[p]
+                if code >= 0 and code not in remap:
+                    value = values[code]
+                    remap[code] = len(new_values)
+                    new_codes[_intern_key(value)] = remap[code]
+                    new_values.append(value)
+                new_column.append(remap[code] if code >= 0 else -1)
+            if new_values:
+                fields[name] = (new_values, new_codes, new_column)
+
+        self._content, self._starts, self._lengths = content, starts, lengths
+        self._fields = fields
+        self._ids = [self._ids[p] for p in keep]
+        self._positions = {doc_id: i for i, doc_id in enumerate(self._ids)}
+        self._alive = array("b", b"\x01" * len(self._ids))
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """还原单个文档块为 {id, content, metadata}，不存在时返回None"""
+        position = self._positions.get(doc_id)
+        if position is None:
+            return None
+        start = self._starts[position]
+        content = self._content[start:start + self._lengths[position]].decode("utf-8")
+        metadata = {}
+        for name, (values, _, column) in self._fields.items():
+            code = column[position]
+            if code >= 0:
+                value = values[code]
+                metadata[name] = list(value) if isinstance(value, list) else value
+        return {"id": doc_id, "content": content, "metadata": metadata}
+
+    def memory_bytes(self) -> int:
+        """占用的内存：缓冲区与数组按实际字节数，字符串、驻留取值与字典按sys.getsizeof计算"""
+        total = len(self._content) + sys.getsizeof(self._positions)
+        total += sum(buffer.itemsize * len(buffer) for buffer in (self._starts, self._lengths, self._alive))
+        total += sum(map(sys.getsizeof, self._ids))
+        for values, codes, column in self._fields.values():
+            total += sum(map(sys.getsizeof, values)) + sys.getsizeof(codes) + column.itemsize * len(column)
+        return total
+
+
+def object_bytes(doc: Dict) -> int:
+    """按sys.getsizeof估计一个dict形式的文档块（含content与metadata）占用的内存"""
+    total = sys.getsizeof(doc) + sum(sys.getsizeof(key) for key in doc)
+    for value in doc.values():
+        total += sys.getsizeof(value)
+        if isinstance(value, dict):
+            total += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in value.items())
+    return total
@@ -3,6 +3,19 @@ OPENAI_API_KEY = ""
 OPENAI_API_BASE = "https://dashscope.aliyuncs.com/compatible-mode/v1"
 MODEL_NAME = "qwen3-max"
 OPENAI_EMBEDDING_MODEL = "text-embedding-v3"
+# 单次embedding请求的最大文本数（DashScope text-embedding-v3 上限为10）
+EMBEDDING_BATCH_SIZE = 10
+
+# API限流与重试配置（按DashScope账号配额调整）
+EMBEDDING_RPM_LIMIT = 1800
+EMBEDDING_TPM_LIMIT = 1200000
+CHAT_RPM_LIMIT = 600
+CHAT_TPM_LIMIT = 1000000
+API_INITIAL_CONCURRENCY = 4
+API_MAX_CONCURRENCY = 32
+API_MAX_RETRIES = 5
+API_BACKOFF_BASE = 1.0
+API_BACKOFF_MAX = 30.0
 
 # 数据目录配置
 DATA_DIR = "./data"
@@ -10,11 +23,74 @@ DATA_DIR = "./data"
 #向量数据库配置
 VECTOR_DB_PATH = "./vector_db"
 COLLECTION_NAME = "course_documents"
+# 多课程服务：每门课程对应一个collection，已加载的课程状态（collection句柄、BM25索引等）
+# 按LRU缓存，估计占用超过上限时淘汰最久未用的课程
+COURSE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# Chroma常驻内存的HNSW段上限（字节），0表示不限制
+CHROMA_MEMORY_LIMIT_BYTES = 0
+# HNSW索引参数，只对新建的collection生效；已有collection打开时若与配置不一致会给出警告，
+# 需运行 python process_data.py --recreate 按当前配置重建索引（复用已存储的embedding）
+# 可用 python hnsw_benchmark.py 对比不同参数下的recall@k与查询延迟
+HNSW_SPACE = "l2"  # 距离度量：l2 / cosine / ip
+HNSW_M = 16  # 每个节点的邻居数，越大召回越高、索引越大
+HNSW_CONSTRUCTION_EF = 100  # 建索引时的候选集大小
+HNSW_SEARCH_EF = 100  # 查询时的候选集大小，越大召回越高、查询越慢
+# 分页读取collection时每页的文档数
+DOCUMENT_PAGE_SIZE = 500
+
+# 入库配置：每批文档块完成embedding后立即写入collection，中断后可用 process_data.py --resume 继续
+INGEST_BATCH_SIZE = 100
+
+# 图片配置：从PDF/PPT中提取插图写入按内容寻址的磁盘存储，文档块只保存引用；
+# 回答时只为最终检索结果按需加载图片，缩放并重新压缩后随问题发送给多模态模型
+ENABLE_IMAGE_EXTRACTION = True
+IMAGE_STORE_DIR = "./vector_db/images"
+IMAGE_MIN_BYTES = 2048  # 小于该大小的图片（图标、装饰线条等）不保存
+# 默认关闭：开启后检索结果所在页含插图时会改用多模态模型回答，费用与延迟随之增加
+ENABLE_IMAGE_CONTEXT = False
+MULTIMODAL_MODEL_NAME = "qwen-vl-max"  # 附带图片时使用的模型
+MAX_CONTEXT_IMAGES = 3  # 每次回答最多附带的图片数
+IMAGE_MAX_SIDE = 768  # 发送前缩放到的最长边（像素）
+IMAGE_JPEG_QUALITY = 75
 
 # 文本处理配置
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 100
 MAX_TOKENS = 1500
+# PDF/PPT每页切分出的子块大小（字符数，中文约等于token数），检索命中子块后再扩展到所在页
+CHILD_CHUNK_SIZE = 300
+CHILD_CHUNK_OVERLAP = 50
+
+# 近重复去重配置（MinHash + LSH）
+ENABLE_DEDUP = True
+DEDUP_THRESHOLD = 0.85
+DEDUP_NUM_PERM = 128
+DEDUP_LSH_BANDS = 16
+DEDUP_SHINGLE_SIZE = 5
+DEDUP_MAX_BUCKET_PAIRWISE = 64  # LSH桶内块数不超过该值时两两比较，更大的桶只与桶内各组的代表块比较
 
 # RAG配置
 TOP_K = 5
+# 子块命中后扩展上下文：整页不超过预算时使用整页，否则从命中子块向相邻子块扩展至预算为止
+EXPAND_TO_PARENT = True
+PARENT_EXPAND_BUDGET = 1200
+
+# 上下文压缩：把检索到的文档块切分为句子，按与查询的BM25相关度每块只保留前N句
+ENABLE_CONTEXT_COMPRESSION = False
+COMPRESSION_SENTENCES_PER_CHUNK = 3
+
+# 追问检索复用：同一会话中，追问的内容词与之前问题的重叠比例达到REUSE阈值时直接复用上一轮检索结果，
+# 达到EXTEND阈值时重新检索并与上一轮结果合并，否则重新检索
+ENABLE_RETRIEVAL_REUSE = True
+REUSE_OVERLAP_THRESHOLD = 0.6
+EXTEND_OVERLAP_THRESHOLD = 0.2
+MAX_SESSIONS = 1000
+
+# 后台预热配置：构造RAGAgent时在后台线程中加载索引、初始化分词并发起一次预热检索
+ENABLE_WARMUP = True
+WARMUP_QUERY = "图论"
+
+# 启动耗时配置：开启后main.py与界面会输出按导入/初始化步骤划分的耗时报告
+STARTUP_PROFILE = False
+STARTUP_TARGET_MAIN = 3.0  # main.py进入对话前的目标耗时（秒）
+STARTUP_TARGET_APP = 1.5  # 界面首次渲染完成的目标耗时（秒）
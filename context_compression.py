@@ -0,0 +1,89 @@
+import math
+import re
+from typing import List, Optional
+
+from bm25_index import BM25Index
+from config import COMPRESSION_SENTENCES_PER_CHUNK
+from startup_profile import timed_import
+
+# 中文句末标点与换行处切分；英文句点后需跟空白，避免切开"3.5"之类的数字
+_SENTENCE_SPLIT = re.compile(r"(?<=[。！？!?\n])|(?<=\.)(?=\s)")
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s for s in _SENTENCE_SPLIT.split(text) if s.strip()]
+
+
+class ContextCompressor:
+    """按查询对检索到的文档块做抽取式压缩，只保留与查询最相关的句子
+
+    句子按BM25打分：有课程BM25索引时使用其中的idf，否则以本次检索到的句子为语料计算idf，
+    不额外调用embedding API
+    """
+
+    def __init__(
+        self,
+        bm25_index: Optional[BM25Index] = None,
+        sentences_per_chunk: int = COMPRESSION_SENTENCES_PER_CHUNK,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ):
+        self.bm25_index = bm25_index
+        self.sentences_per_chunk = sentences_per_chunk
+        self.k1 = k1
+        self.b = b
+
+    def compress_chunks(self, query: str, contents: List[str]) -> List[str]:
+        """压缩多个文档块，返回与输入一一对应的压缩后内容"""
+        jieba = timed_import("jieba")
+        query_terms = set(jieba.lcut(query)) - {" "}
+        sentences = [split_sentences(content) for content in contents]
+        tokenized = [[jieba.lcut(s) for s in chunk] for chunk in sentences]
+
+        all_sentences = [tokens for chunk in tokenized for tokens in chunk]
+        if not all_sentences:
+            return list(contents)
+        avg_len = sum(len(tokens) for tokens in all_sentences) / len(all_sentences) or 1.0
+        idf = {term: self._idf(term, all_sentences) for term in query_terms}
+
+        compressed = []
+        for content, chunk_sentences, chunk_tokens in zip(contents, sentences, tokenized):
+            if len(chunk_sentences) <= self.sentences_per_chunk:
+                compressed.append(content)
+                continue
+            scores = [self._score(tokens, idf, avg_len) for tokens in chunk_tokens]
+            ranked = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+            keep = sorted(i for i in ranked[:self.sentences_per_chunk] if scores[i] > 0)
+            if not keep:
+                # 没有句子命中查询词时保留开头，避免丢掉整块
+                keep = list(range(self.sentences_per_chunk))
+            compressed.append(self._join(chunk_sentences, keep))
+        return compressed
+
+    def _idf(self, term: str, sentences: List[List[str]]) -> float:
+        if self.bm25_index is not None and len(self.bm25_index):
+            return self.bm25_index.idf(term)
+        df = sum(1 for tokens in sentences if term in tokens)
+        n = len(sentences)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def _score(self, tokens: List[str], idf: dict, avg_len: float) -> float:
+        score = 0.0
+        norm = self.k1 * (1 - self.b + self.b * len(tokens) / avg_len)
+        for term, weight in idf.items():
+            tf = tokens.count(term)
+            if tf:
+                score += weight * tf * (self.k1 + 1) / (tf + norm)
+        return score
+
+    @staticmethod
+    def _join(sentences: List[str], keep: List[int]) -> str:
+        """按原顺序拼接保留的句子，不相邻处用省略号标出"""
+        parts = []
+        previous = None
+        for i in keep:
+            if previous is not None and i != previous + 1:
+                parts.append("……")
+            parts.append(sentences[i].strip())
+            previous = i
+        return "".join(parts)
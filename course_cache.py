@@ -0,0 +1,106 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict
+
+
+class CourseCache:
+    """按课程（collection名称）缓存已加载状态的LRU，总内存超过上限时淘汰最久未用的课程
+
+    loader(course)负责加载课程状态，size_of(state)估计其占用的字节数。
+    刚加载的课程即使单独超过上限也会保留，保证当前请求可用。
+    加载在全局锁之外进行，只有请求同一门课程的调用方会等待其加载完成，其他课程不受影响。
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[str], Any],
+        max_bytes: int,
+        size_of: Callable[[Any], int],
+    ):
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self.size_of = size_of
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._loading: Dict[str, Future] = {}
+        self._lock = threading.RLock()
+
+    def _course_stats(self, course: str) -> Dict[str, int]:
+        return self._stats.setdefault(course, {"hits": 0, "misses": 0, "evictions": 0, "bytes": 0})
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(self._sizes.values())
+
+    def get(self, course: str) -> Any:
+        with self._lock:
+            stats = self._course_stats(course)
+            if course in self._entries:
+                self._entries.move_to_end(course)
+                stats["hits"] += 1
+                return self._entries[course]
+
+            stats["misses"] += 1
+            future = self._loading.get(course)
+            owner = future is None
+            if owner:
+                future = self._loading[course] = Future()
+
+        if not owner:
+            # 同一课程正由其他请求加载，等待其结果（加载失败时抛出同样的异常）
+            return future.result()
+
+        try:
+            state = self.loader(course)
+        except BaseException as e:
+            with self._lock:
+                if self._loading.get(course) is future:
+                    del self._loading[course]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            # 加载期间课程被invalidate时，结果只交给本次等待的请求，不放入缓存
+            if self._loading.get(course) is future:
+                del self._loading[course]
+                self._entries[course] = state
+                self._sizes[course] = self.size_of(state)
+                self._course_stats(course)["bytes"] = self._sizes[course]
+                self._evict(keep=course)
+        future.set_result(state)
+        return state
+
+    def _evict(self, keep: str) -> None:
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            course = next(iter(self._entries))
+            if course == keep:
+                break
+            del self._entries[course]
+            del self._sizes[course]
+            stats = self._course_stats(course)
+            stats["evictions"] += 1
+            stats["bytes"] = 0
+
+    def refresh_size(self, course: str) -> None:
+        """课程状态增量变化（如BM25索引增删文档）后重新估计其大小"""
+        with self._lock:
+            if course in self._entries:
+                self._sizes[course] = self.size_of(self._entries[course])
+                self._course_stats(course)["bytes"] = self._sizes[course]
+                self._evict(keep=course)
+
+    def invalidate(self, course: str) -> None:
+        """丢弃课程的缓存状态（如知识库重建后），下次访问时重新加载"""
+        with self._lock:
+            self._entries.pop(course, None)
+            self._sizes.pop(course, None)
+            self._loading.pop(course, None)
+            if course in self._stats:
+                self._stats[course]["bytes"] = 0
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """各课程的命中、未命中、淘汰次数及当前占用字节数"""
+        with self._lock:
+            return {course: dict(stats) for course, stats in self._stats.items()}
@@ -0,0 +1,163 @@
+import re
+import zlib
+from typing import List, Dict, Optional
+
+import numpy as np
+from tqdm import tqdm
+
+from config import (
+    DEDUP_THRESHOLD,
+    DEDUP_NUM_PERM,
+    DEDUP_LSH_BANDS,
+    DEDUP_SHINGLE_SIZE,
+    DEDUP_MAX_BUCKET_PAIRWISE,
+)
+
+# MinHash使用的梅森素数，哈希值与参数均小于2^32，乘积不会溢出uint64
+_MERSENNE_PRIME = (1 << 31) - 1
+# 页眉（如"--- 第 3 页 ---"）中的页码会让相同内容看起来不同，比较前去掉
+_PAGE_HEADER_PATTERN = re.compile(r"---\s*(第\s*\d+\s*页|幻灯片\s*\d+)\s*---")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+class ChunkDeduplicator:
+    """基于MinHash + LSH的近重复文档块检测
+
+    位于TextSplitter.split_documents与VectorStore.add_documents之间：
+    Jaccard相似度超过阈值的文档块被合并为一个，保留的块在"sources"中记录全部来源
+    """
+
+    def __init__(
+        self,
+        threshold: float = DEDUP_THRESHOLD,
+        num_perm: int = DEDUP_NUM_PERM,
+        bands: int = DEDUP_LSH_BANDS,
+        shingle_size: int = DEDUP_SHINGLE_SIZE,
+        max_bucket_pairwise: int = DEDUP_MAX_BUCKET_PAIRWISE,
+        seed: int = 1,
+    ):
+        if num_perm % bands != 0:
+            raise ValueError(f"num_perm({num_perm})必须能被bands({bands})整除")
+
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.max_bucket_pairwise = max_bucket_pairwise
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+        self.stats = {}
+
+    def _normalize(self, text: str) -> str:
+        text = _PAGE_HEADER_PATTERN.sub("", text)
+        return _WHITESPACE_PATTERN.sub("", text).lower()
+
+    def _shingles(self, text: str) -> set:
+        """字符级n-gram，对中英文混排都适用"""
+        k = self.shingle_size
+        if len(text) <= k:
+            return {text}
+        return {text[i:i + k] for i in range(len(text) - k + 1)}
+
+    def minhash(self, text: str) -> Optional[np.ndarray]:
+        """计算文本的MinHash签名，空文本返回None"""
+        normalized = self._normalize(text)
+        if not normalized:
+            return None
+
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in self._shingles(normalized)),
+            dtype=np.uint64,
+        )
+        permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % _MERSENNE_PRIME
+        return permuted.min(axis=1)
+
+    def deduplicate(self, chunks: List[Dict]) -> List[Dict]:
+        """合并近重复文档块，返回去重后的文档块列表（保持原有顺序）"""
+        signatures = [
+            self.minhash(chunk.get("content", ""))
+            for chunk in tqdm(chunks, desc="计算MinHash", unit="块")
+        ]
+
+        parent = list(range(len(chunks)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        # LSH分桶：任意一个band完全相同的块才作为候选对，再用签名估计Jaccard相似度确认
+        buckets = {}
+        for idx, sig in enumerate(signatures):
+            if sig is None:
+                continue
+            for band in range(self.bands):
+                key = (band, sig[band * self.rows:(band + 1) * self.rows].tobytes())
+                buckets.setdefault(key, []).append(idx)
+
+        def union(i, j):
+            root_i, root_j = find(i), find(j)
+            if root_i != root_j:
+                # 以较早出现的块作为代表
+                parent[max(root_i, root_j)] = min(root_i, root_j)
+
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            if len(members) <= self.max_bucket_pairwise:
+                # 小桶两两比较，避免A≈B、A≈C但B不像A时漏掉B≈C
+                stacked = np.stack([signatures[i] for i in members])
+                similarity = (stacked[:, None, :] == stacked[None, :, :]).mean(axis=2)
+                for a, b in zip(*np.nonzero(np.triu(similarity >= self.threshold, k=1))):
+                    union(members[a], members[b])
+                continue
+            # 大桶（如大量模板化的页面）两两比较代价过高，每个块只与桶内已有各组的代表块比较
+            representatives = []
+            for idx in members:
+                for rep in representatives:
+                    if find(idx) == find(rep):
+                        break
+                    if float(np.mean(signatures[idx] == signatures[rep])) >= self.threshold:
+                        union(idx, rep)
+                        break
+                else:
+                    representatives.append(idx)
+
+        groups = {}
+        for idx in range(len(chunks)):
+            groups.setdefault(find(idx), []).append(idx)
+
+        deduplicated = []
+        bytes_saved = 0
+        for root in sorted(groups):
+            members = groups[root]
+            chunk = dict(chunks[root])
+            chunk["sources"] = [self._source_of(chunks[i]) for i in members]
+            deduplicated.append(chunk)
+            bytes_saved += sum(len(chunks[i].get("content", "").encode("utf-8")) for i in members[1:])
+
+        self.stats = {
+            "input_chunks": len(chunks),
+            "output_chunks": len(deduplicated),
+            "embeddings_saved": len(chunks) - len(deduplicated),
+            "bytes_saved": bytes_saved,
+        }
+        print(
+            f"\n近重复去重完成：{len(chunks)} -> {len(deduplicated)} 个块，"
+            f"节省 {self.stats['embeddings_saved']} 次embedding，{bytes_saved} 字节文本"
+        )
+        return deduplicated
+
+    @staticmethod
+    def _source_of(chunk: Dict) -> Dict:
+        return {
+            "filename": chunk.get("filename", "unknown"),
+            "filepath": chunk.get("filepath", ""),
+            "page_number": chunk.get("page_number", 0),
+            "chunk_id": chunk.get("chunk_id", 0),
+        }
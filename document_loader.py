@@ -1,20 +1,23 @@
 import os
 from typing import List, Dict, Optional
 
-import docx2txt
-from PyPDF2 import PdfReader
-from pptx import Presentation
-import easyocr  # 直接导入
-
-from config import DATA_DIR
+from config import DATA_DIR, ENABLE_IMAGE_EXTRACTION
+from image_store import ImageStore
+# 各格式的解析库（尤其是依赖torch的easyocr）导入很慢，延迟到加载对应格式时再导入
+from startup_profile import timed_import
 
 
 class DocumentLoader:
     def __init__(
         self,
         data_dir: str = DATA_DIR,
+        image_store: Optional[ImageStore] = None,
     ):
         self.data_dir = data_dir
+        # 插图写入磁盘，文档只保留引用；image_store为None且配置关闭提取时不提取插图
+        if image_store is None and ENABLE_IMAGE_EXTRACTION:
+            image_store = ImageStore()
+        self.image_store = image_store
         self.supported_formats = [".pdf", ".pptx", ".docx", ".txt"]
         # 仅保留前三种图片格式
         self.image_formats = [".jpg", ".jpeg", ".png"]
@@ -29,15 +32,30 @@ class DocumentLoader:
         2. 遍历每一页，提取文本内容
         3. 格式化为"--- 第 X 页 ---\n文本内容\n"
         4. 返回pdf内容列表，每个元素包含 {"text": "..."}
+        提取插图时，每个元素另含 "images": 图片引用列表
         """
         pages = []
-        reader = PdfReader(file_path)
+        reader = timed_import("PyPDF2").PdfReader(file_path)
         for page_num, page in enumerate(reader.pages, 1):
             text = page.extract_text()
             formatted_text = f"--- 第 {page_num} 页 ---\n{text}\n"
-            pages.append({"text": formatted_text})
+            pages.append({"text": formatted_text, "images": self._extract_pdf_images(page)})
         return pages
 
+    def _extract_pdf_images(self, page) -> List[str]:
+        if self.image_store is None:
+            return []
+        refs = []
+        try:
+            for image in page.images:
+                ref = self.image_store.put(image.data, os.path.splitext(image.name)[1])
+                if ref and ref not in refs:
+                    refs.append(ref)
+        except Exception:
+            # 个别页的图片编码PyPDF2无法解析，保留已提取的图片，不影响文本提取
+            pass
+        return refs
+
     def load_pptx(self, file_path: str) -> List[Dict]:
         """加载PPT文件，按幻灯片返回内容
 
@@ -49,7 +67,7 @@ class DocumentLoader:
         4. 返回幻灯片内容列表，每个元素包含 {"text": "..."}
         """
         slides = []
-        prs = Presentation(file_path)
+        prs = timed_import("pptx").Presentation(file_path)
         for slide_num, slide in enumerate(prs.slides, 1):
             text_parts = []
             for shape in slide.shapes:
@@ -57,9 +75,29 @@ class DocumentLoader:
                     text_parts.append(shape.text)
             text = "\n".join(text_parts)
             formatted_text = f"--- 幻灯片 {slide_num} ---\n{text}\n"
-            slides.append({"text": formatted_text})
+            slides.append({"text": formatted_text, "images": self._extract_pptx_images(slide.shapes)})
         return slides
 
+    def _extract_pptx_images(self, shapes, refs: Optional[List[str]] = None) -> List[str]:
+        """提取幻灯片中的图片，组合形状中的图片同样提取"""
+        refs = [] if refs is None else refs
+        if self.image_store is None:
+            return refs
+        shape_type = timed_import("pptx.enum.shapes").MSO_SHAPE_TYPE
+        for shape in shapes:
+            if shape.shape_type == shape_type.GROUP:
+                self._extract_pptx_images(shape.shapes, refs)
+            elif shape.shape_type == shape_type.PICTURE:
+                try:
+                    image = shape.image
+                except Exception:
+                    # 链接到外部文件的图片没有内嵌数据
+                    continue
+                ref = self.image_store.put(image.blob, image.ext)
+                if ref and ref not in refs:
+                    refs.append(ref)
+        return refs
+
     def load_docx(self, file_path: str) -> str:
         """加载DOCX文件
         TODO: 实现DOCX文件加载
@@ -67,7 +105,7 @@ class DocumentLoader:
         1. 使用docx2txt读取DOCX文件
         2. 返回文本内容
         """
-        text = docx2txt.process(file_path)
+        text = timed_import("docx2txt").process(file_path)
         return text
 
     def load_txt(self, file_path: str) -> str:
@@ -86,7 +124,7 @@ class DocumentLoader:
         # 默认中英双语；lang 可选地限制为英文
         langs = ["ch_sim", "en"] if (lang is None or lang.startswith("chi")) else ["en"]
         # 直接初始化 Reader（CPU），如果你有 GPU 可将 gpu=True
-        reader = easyocr.Reader(langs, gpu=False)
+        reader = timed_import("easyocr").Reader(langs, gpu=False)
         texts = reader.readtext(file_path, detail=0, paragraph=True)
         text = "\n".join(s.strip() for s in texts if s and str(s).strip())
         return text
@@ -107,6 +145,7 @@ class DocumentLoader:
                         "filepath": file_path,
                         "filetype": ext,
                         "page_number": page_idx,
+                        "images": page_data.get("images", []),
                     }
                 )
         elif ext == ".pptx":
@@ -119,6 +158,7 @@ class DocumentLoader:
                         "filepath": file_path,
                         "filetype": ext,
                         "page_number": slide_idx,
+                        "images": slide_data.get("images", []),
                     }
                 )
         elif ext == ".docx":
@@ -149,6 +189,11 @@ class DocumentLoader:
             # 默认中英识别，尽量覆盖中文课件
             content = self.load_image(file_path, lang=None)
             if content:
+                images = []
+                if self.image_store is not None:
+                    with open(file_path, "rb") as f:
+                        ref = self.image_store.put(f.read(), ext)
+                    images = [ref] if ref else []
                 documents.append(
                     {
                         "content": content,
@@ -156,6 +201,7 @@ class DocumentLoader:
                         "filepath": file_path,
                         "filetype": ext,
                         "page_number": 0,
+                        "images": images,
                     }
                 )
         else:
@@ -163,6 +209,16 @@ class DocumentLoader:
 
         return documents
 
+    def list_files(self) -> List[str]:
+        """数据目录下所有支持格式的文件路径（按路径排序，保证每次运行顺序一致）"""
+        paths = []
+        for root, dirs, files in os.walk(self.data_dir):
+            for file in files:
+                ext = os.path.splitext(file)[1].lower()
+                if ext in self.supported_formats:
+                    paths.append(os.path.join(root, file))
+        return sorted(paths)
+
     def load_all_documents(self) -> List[Dict[str, str]]:
         """加载数据目录下的所有文档"""
         if not os.path.exists(self.data_dir):
@@ -171,14 +227,10 @@ class DocumentLoader:
 
         documents = []
 
-        for root, dirs, files in os.walk(self.data_dir):
-            for file in files:
-                ext = os.path.splitext(file)[1].lower()
-                if ext in self.supported_formats:
-                    file_path = os.path.join(root, file)
-                    print(f"正在加载: {file_path}")
-                    doc_chunks = self.load_document(file_path)
-                    if doc_chunks:
-                        documents.extend(doc_chunks)
+        for file_path in self.list_files():
+            print(f"正在加载: {file_path}")
+            doc_chunks = self.load_document(file_path)
+            if doc_chunks:
+                documents.extend(doc_chunks)
 
         return documents
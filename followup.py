@@ -0,0 +1,117 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
+
+from config import (
+    REUSE_OVERLAP_THRESHOLD,
+    EXTEND_OVERLAP_THRESHOLD,
+    MAX_SESSIONS,
+)
+from startup_profile import timed_import
+
+# 追问中常见、本身不携带检索信息的词
+_FOLLOWUP_STOPWORDS = {
+    "能", "能否", "可以", "可否", "请", "再", "还", "又", "解释", "一下", "详细", "具体", "说说", "讲讲",
+    "说明", "展开", "举例", "例子", "举个", "一个", "吗", "呢", "吧", "啊", "呀", "么", "这个", "那个",
+    "这", "那", "它", "它们", "这里", "那里", "刚才", "上面", "前面", "之前", "为什么", "为何", "怎么",
+    "怎样", "如何", "什么", "哪", "哪里", "我", "你", "我们", "的", "了", "是", "和", "与", "不",
+    "没", "懂", "明白", "理解", "没懂", "不太", "一步", "步骤", "部分",
+}
+# 完全由这些字组成的词（如jieba切出的"解释一下""说一下"）同样视为套话
+_FILLER_CHARS = set("能否可以请再还又解释一下详细具体说讲明展开举例个吗呢吧啊呀么这那它们里刚才上面前之为什何怎样如我你的了是和与不没懂白理")
+# "第二步""第3点"等指代上一轮内容的序数短语
+_ORDINAL_PATTERN = re.compile(r"^第[一二三四五六七八九十百\d]+[步个点条问种部分题项]*$")
+_PUNCTUATION_PATTERN = re.compile(r"^[\W_]+$")
+
+
+def content_tokens(query: str) -> set:
+    """提取查询中携带检索信息的词（去掉追问套话、指代词和标点）"""
+    tokens = set()
+    for token in timed_import("jieba").lcut(query.lower()):
+        token = token.strip()
+        if not token or token in _FOLLOWUP_STOPWORDS or set(token) <= _FILLER_CHARS:
+            continue
+        if _PUNCTUATION_PATTERN.match(token) or _ORDINAL_PATTERN.match(token):
+            continue
+        tokens.add(token)
+    return tokens
+
+
+class SessionRetrievalCache:
+    """按会话保存上一轮的检索结果，判断追问是复用、扩展还是重新检索
+
+    - 复用(reuse)：追问几乎没有新的内容词，或内容词大部分已出现在之前的问题中，直接使用上一轮的检索结果
+    - 扩展(extend)：有部分重叠也有新内容，重新检索后与上一轮结果交错合并
+    - 重新检索(fresh)：话题已切换
+    """
+
+    def __init__(
+        self,
+        reuse_threshold: float = REUSE_OVERLAP_THRESHOLD,
+        extend_threshold: float = EXTEND_OVERLAP_THRESHOLD,
+        max_sessions: int = MAX_SESSIONS,
+    ):
+        self.reuse_threshold = reuse_threshold
+        self.extend_threshold = extend_threshold
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"fresh": 0, "extended": 0, "reused": 0, "saved_retrievals": 0}
+
+    def decide(self, session_id: str, query: str, course: str) -> Tuple[str, Optional[Dict], set]:
+        """返回 (决策, 上一轮记录, 本轮内容词)，决策为 "reuse" / "extend" / "fresh" """
+        tokens = content_tokens(query)
+        with self._lock:
+            previous = self._sessions.get(session_id)
+        if previous is None or previous["course"] != course or not previous["docs"]:
+            return "fresh", previous, tokens
+        if not tokens:
+            return "reuse", previous, tokens
+
+        overlap = len(tokens & previous["tokens"]) / len(tokens)
+        if overlap >= self.reuse_threshold:
+            return "reuse", previous, tokens
+        if overlap >= self.extend_threshold:
+            return "extend", previous, tokens
+        return "fresh", previous, tokens
+
+    def record(self, session_id: str, decision: str, course: str, tokens: set, docs: List[Dict],
+               previous: Optional[Dict]) -> None:
+        """保存本轮检索结果并更新统计"""
+        if decision != "fresh" and previous is not None:
+            # 仍在同一话题上，累积之前的内容词，便于识别连续追问
+            tokens = tokens | previous["tokens"]
+        with self._lock:
+            self._sessions[session_id] = {"course": course, "tokens": tokens, "docs": docs}
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+            key = {"fresh": "fresh", "extend": "extended", "reuse": "reused"}[decision]
+            self.stats[key] += 1
+            if decision == "reuse":
+                # 省去一次embedding请求和一次向量检索
+                self.stats["saved_retrievals"] += 1
+
+    def clear(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def metrics(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stats)
+
+
+def merge_results(new_docs: List[Dict], previous_docs: List[Dict], top_k: int) -> List[Dict]:
+    """交错合并本轮与上一轮的检索结果，按id（无id时按内容）去重，保留top_k条"""
+    merged = []
+    seen = set()
+    for i in range(max(len(new_docs), len(previous_docs))):
+        for docs in (new_docs, previous_docs):
+            if i < len(docs):
+                key = docs[i].get("id") or docs[i].get("content", "")
+                if key not in seen:
+                    seen.add(key)
+                    merged.append(docs[i])
+    return merged[:top_k]
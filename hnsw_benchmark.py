@@ -0,0 +1,191 @@
+"""HNSW参数的召回率与延迟评测
+
+读取collection中已存储的embedding，为每组参数（距离度量、M、construction_ef、search_ef）
+在临时目录中建一个同样内容的collection，与numpy暴力检索得到的精确近邻对比，
+报告recall@k、平均与p95查询延迟以及建索引耗时。不会改动原collection。
+
+查询集默认从已存储的embedding中随机抽样；也可以用 --queries 指定每行一个问题的文本文件，
+此时会调用embedding API获取查询向量。
+
+用法：
+    python hnsw_benchmark.py
+    python hnsw_benchmark.py --k 10 --m 16 32 --search-ef 10 50 100 --queries questions.txt
+"""
+import argparse
+import itertools
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+from tqdm import tqdm
+
+from config import (
+    HNSW_SPACE,
+    HNSW_M,
+    HNSW_CONSTRUCTION_EF,
+    HNSW_SEARCH_EF,
+    TOP_K,
+)
+from startup_profile import timed_import
+from vector_store import VectorStore, collection_metadata
+
+# 未在命令行指定时评测的参数网格，当前配置的取值总会包含在内
+DEFAULT_M = [8, 16, 32]
+DEFAULT_CONSTRUCTION_EF = [100, 200]
+DEFAULT_SEARCH_EF = [10, 50, 100, 200]
+
+
+def load_embeddings(vector_store: VectorStore) -> np.ndarray:
+    """分页读取collection中全部embedding，返回float32矩阵（行顺序与id无关）"""
+    rows = [
+        np.asarray(doc["embedding"], dtype=np.float32)
+        for doc in tqdm(
+            vector_store.iter_documents(include=("embeddings",)),
+            total=vector_store.get_collection_count(), desc="读取embedding", unit="块",
+        )
+    ]
+    return np.vstack(rows) if rows else np.zeros((0, 0), dtype=np.float32)
+
+
+def exact_neighbors(corpus: np.ndarray, queries: np.ndarray, k: int, space: str, batch_size: int = 256) -> np.ndarray:
+    """暴力计算每个查询的精确top-k近邻（行号），距离定义与Chroma的hnsw:space一致"""
+    if space == "cosine":
+        corpus = corpus / np.maximum(np.linalg.norm(corpus, axis=1, keepdims=True), 1e-12)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    corpus_sq = (corpus ** 2).sum(axis=1) if space == "l2" else None
+
+    neighbors = []
+    for start in range(0, len(queries), batch_size):
+        batch = queries[start:start + batch_size]
+        similarity = batch @ corpus.T
+        # l2按平方距离排序（省去与查询无关的|q|^2项），cosine与ip按内积从大到小
+        distance = corpus_sq[None, :] - 2 * similarity if space == "l2" else -similarity
+        top = np.argpartition(distance, k - 1, axis=1)[:, :k]
+        order = np.argsort(np.take_along_axis(distance, top, axis=1), axis=1)
+        neighbors.append(np.take_along_axis(top, order, axis=1))
+    return np.vstack(neighbors)
+
+
+def _build_collection(client, name: str, corpus: np.ndarray, params: Dict) -> float:
+    """在临时数据库中按给定参数建collection，返回建索引耗时（秒）"""
+    collection = client.create_collection(
+        name=name,
+        metadata=collection_metadata(
+            "HNSW评测", params["space"], params["m"], params["construction_ef"], params["search_ef"]
+        ),
+    )
+    batch_size = client.get_max_batch_size()
+    started = time.perf_counter()
+    for start in range(0, len(corpus), batch_size):
+        batch = corpus[start:start + batch_size]
+        collection.add(ids=[str(i) for i in range(start, start + len(batch))], embeddings=batch)
+    return time.perf_counter() - started
+
+
+def evaluate(
+    corpus: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    spaces: List[str],
+    ms: List[int],
+    construction_efs: List[int],
+    search_efs: List[int],
+) -> List[Dict]:
+    """对参数网格中的每一组参数评测recall@k与查询延迟"""
+    chromadb = timed_import("chromadb")
+    settings = timed_import("chromadb.config").Settings(anonymized_telemetry=False)
+    exact = {space: exact_neighbors(corpus, queries, k, space) for space in spaces}
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        client = chromadb.PersistentClient(path=tmp_dir, settings=settings)
+        grid = list(itertools.product(spaces, ms, construction_efs, search_efs))
+        for i, (space, m, construction_ef, search_ef) in enumerate(grid):
+            params = {"space": space, "m": m, "construction_ef": construction_ef, "search_ef": search_ef}
+            name = f"hnsw_bench_{i}"
+            build_seconds = _build_collection(client, name, corpus, params)
+            collection = client.get_collection(name)
+
+            latencies = []
+            hits = 0
+            for query, truth in zip(queries, exact[space]):
+                started = time.perf_counter()
+                found = collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])
+                latencies.append(time.perf_counter() - started)
+                hits += len(set(int(doc_id) for doc_id in found["ids"][0]) & set(truth.tolist()))
+            client.delete_collection(name)
+
+            latencies = np.array(latencies) * 1000
+            result = dict(
+                params,
+                recall=hits / (len(queries) * k),
+                mean_ms=float(latencies.mean()),
+                p95_ms=float(np.percentile(latencies, 95)),
+                build_s=build_seconds,
+            )
+            results.append(result)
+            print(
+                f"[{i + 1}/{len(grid)}] space={space} M={m} construction_ef={construction_ef} "
+                f"search_ef={search_ef}: recall@{k}={result['recall']:.4f} p95={result['p95_ms']:.2f}ms"
+            )
+    return results
+
+
+def print_report(results: List[Dict], k: int) -> None:
+    print(f"\n{'space':<8}{'M':>5}{'c_ef':>7}{'s_ef':>7}{f'recall@{k}':>12}{'mean(ms)':>11}{'p95(ms)':>10}{'build(s)':>10}")
+    for r in sorted(results, key=lambda r: (r["space"], -r["recall"], r["p95_ms"])):
+        current = (r["space"], r["m"], r["construction_ef"], r["search_ef"]) == (
+            HNSW_SPACE, HNSW_M, HNSW_CONSTRUCTION_EF, HNSW_SEARCH_EF
+        )
+        print(
+            f"{r['space']:<8}{r['m']:>5}{r['construction_ef']:>7}{r['search_ef']:>7}"
+            f"{r['recall']:>12.4f}{r['mean_ms']:>11.2f}{r['p95_ms']:>10.2f}{r['build_s']:>10.1f}"
+            + ("  <- 当前配置" if current else "")
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="评测HNSW参数的recall@k与查询延迟")
+    parser.add_argument("--collection", default=None, help="要评测的collection，默认使用配置中的名称")
+    parser.add_argument("--k", type=int, default=TOP_K * 2, help="评测的top-k，默认与混合检索的候选数一致")
+    parser.add_argument("--num-queries", type=int, default=200, help="抽样的查询数量")
+    parser.add_argument("--queries", default=None, help="每行一个问题的文本文件，指定时用真实问题代替抽样的embedding")
+    parser.add_argument("--space", nargs="+", default=[HNSW_SPACE], choices=["l2", "cosine", "ip"])
+    parser.add_argument("--m", nargs="+", type=int, default=None)
+    parser.add_argument("--construction-ef", nargs="+", type=int, default=None)
+    parser.add_argument("--search-ef", nargs="+", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    kwargs = {"collection_name": args.collection} if args.collection else {}
+    vector_store = VectorStore(create=False, **kwargs)
+    corpus = load_embeddings(vector_store)
+    if len(corpus) <= args.k:
+        print(f"collection中只有 {len(corpus)} 个文档块，不足以评测top-{args.k}")
+        return
+
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+        queries = np.asarray(vector_store.get_embeddings(questions), dtype=np.float32)
+    else:
+        rng = np.random.RandomState(args.seed)
+        sample = rng.choice(len(corpus), size=min(args.num_queries, len(corpus)), replace=False)
+        queries = corpus[sample]
+
+    results = evaluate(
+        corpus,
+        queries,
+        args.k,
+        spaces=args.space,
+        ms=args.m or sorted(set(DEFAULT_M) | {HNSW_M}),
+        construction_efs=args.construction_ef or sorted(set(DEFAULT_CONSTRUCTION_EF) | {HNSW_CONSTRUCTION_EF}),
+        search_efs=args.search_ef or sorted(set(DEFAULT_SEARCH_EF) | {HNSW_SEARCH_EF}),
+    )
+    print(f"\n语料 {len(corpus)} 个文档块，查询 {len(queries)} 条，维度 {corpus.shape[1]}")
+    print_report(results, args.k)
+
+
+if __name__ == "__main__":
+    main()
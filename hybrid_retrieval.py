@@ -1,6 +1,8 @@
-from typing import List, Dict
-from rank_bm25 import BM25Okapi
-import jieba
+import os
+from typing import List, Dict, Iterable
+from bm25_index import BM25Index, bm25_index_path
+from compact_corpus import CompactCorpus, object_bytes
+from startup_profile import timed_import
 from vector_store import VectorStore
 
 
@@ -10,43 +12,111 @@ class HybridRetrieval:
     def __init__(self, vector_store: VectorStore):
         self.vector_store = vector_store
         self.bm25 = None
-        self.documents = []
-        self.doc_ids = []
-
-    def build_bm25_index(self, documents: List[Dict[str, str]]):
-        """构建BM25索引"""
-        self.documents = documents
-        self.doc_ids = [doc.get("id", f"doc_{i}") for i, doc in enumerate(documents)]
-
-        # 中文分词处理
-        tokenized_docs = []
+        self.documents = CompactCorpus()  # 文档块的列式副本，只为最终结果还原内容
+
+    def build_bm25_index(self, documents: Iterable[Dict[str, str]]):
+        """从头构建BM25索引
+
+        documents可以是列表，也可以是VectorStore.iter_documents返回的分页迭代器。
+        已有索引的正排会被复用，内容未变的文档块无需重新分词；
+        向量数据库目录下存在持久化的BM25索引（如由快照导入）时，同样复用其中的分词结果
+        """
+        index = BM25Index()
+        if self.bm25 is not None:
+            index.seed(self.bm25)
+        else:
+            saved_path = bm25_index_path(self.vector_store.db_path, self.vector_store.collection_name)
+            if os.path.exists(saved_path):
+                index.seed(BM25Index.load(saved_path))
+
+        corpus = CompactCorpus()
+        object_size = 0
+        for i, doc in enumerate(documents):
+            doc = dict(doc, id=doc.get("id", f"doc_{i}"))
+            object_size += object_bytes(doc)
+            corpus.add([doc])
+            index.add([doc])
+        index.compact()
+        # 构建完成后不再需要旧索引的分词结果，释放其内存
+        index.seed(None)
+
+        # 全部读取成功后再替换，读取中途出错时保留原有索引
+        self.documents = corpus
+        self.bm25 = index
+        if len(corpus):
+            print(
+                f"BM25索引已构建：{len(corpus)} 个文档块，文档副本 {object_size / 1024 / 1024:.1f}MB（逐块dict）"
+                f" -> {corpus.memory_bytes() / 1024 / 1024:.1f}MB（列式），"
+                f"倒排索引 {index.memory_bytes() / 1024 / 1024:.1f}MB"
+            )
+
+    def add_documents(self, documents: Iterable[Dict[str, str]]):
+        """增量加入文档块（需包含id），id已存在时替换"""
+        if self.bm25 is None:
+            self.bm25 = BM25Index()
         for doc in documents:
-            content = doc.get("content", "")
-            tokens = jieba.lcut(content)
-            tokenized_docs.append(tokens)
+            self.documents.add([doc])
+            self.bm25.add([doc])
 
-        self.bm25 = BM25Okapi(tokenized_docs)
+    def remove_documents(self, ids: Iterable[str]):
+        """增量移除文档块"""
+        if self.bm25 is None:
+            return
+        ids = list(ids)
+        self.bm25.remove(ids)
+        self.documents.remove(ids)
+
+    def memory_bytes(self) -> int:
+        """BM25索引与文档副本占用的内存"""
+        return self.documents.memory_bytes() + (self.bm25.memory_bytes() if self.bm25 is not None else 0)
 
     def bm25_search(self, query: str, top_k: int = 10) -> List[Dict]:
         """BM25检索"""
         if not self.bm25:
             return []
 
-        query_tokens = jieba.lcut(query)
+        query_tokens = timed_import("jieba").lcut(query)
         bm25_scores = self.bm25.get_scores(query_tokens)
 
-        # 获取top_k结果
-        top_indices = sorted(range(len(bm25_scores)), key=lambda i: bm25_scores[i], reverse=True)[:top_k]
+        return self._format_bm25_results(self.bm25.top_k(bm25_scores, top_k))
+
+    def bm25_search_batch(self, queries: List[str], top_k: int = 10) -> List[List[Dict]]:
+        """批量BM25检索
+
+        所有查询共享的词项只计算一次得分，再按查询累加
+        """
+        if not self.bm25:
+            return [[] for _ in queries]
+
+        tokenized_queries = [timed_import("jieba").lcut(query) for query in queries]
+        term_scores = {
+            token: self.bm25.term_scores(token)
+            for token in set(t for tokens in tokenized_queries for t in tokens)
+        }
 
         results = []
-        for idx in top_indices:
-            if bm25_scores[idx] > 0:
-                results.append({
-                    "content": self.documents[idx].get("content", ""),
-                    "metadata": self.documents[idx],
-                    "score": float(bm25_scores[idx]),
-                    "source": "bm25"
-                })
+        for tokens in tokenized_queries:
+            bm25_scores = self.bm25.get_scores([])
+            for token in tokens:
+                positions, scores = term_scores[token]
+                bm25_scores[positions] += scores
+            results.append(self._format_bm25_results(self.bm25.top_k(bm25_scores, top_k)))
+        return results
+
+    def _format_bm25_results(self, top_items: List) -> List[Dict]:
+        """把BM25的 (文档id, 得分) 还原为完整结果，只有这里会物化文档内容"""
+        results = []
+        for doc_id, score in top_items:
+            doc = self.documents.get(doc_id)
+            if doc is None:
+                continue
+            results.append({
+                "id": doc_id,
+                "content": doc["content"],
+                "metadata": doc["metadata"],
+                "score": score,
+                "source": "bm25"
+            })
 
         return results
 
@@ -58,20 +128,29 @@ class HybridRetrieval:
             result["score"] = result.get("distance", 0)  # 距离越小越相似
         return results
 
+    def vector_search_batch(self, queries: List[str], top_k: int = 10) -> List[List[Dict]]:
+        """批量向量检索"""
+        batch_results = self.vector_store.search_batch(queries, top_k=top_k)
+        for results in batch_results:
+            for result in results:
+                result["source"] = "vector"
+                result["score"] = result.get("distance", 0)
+        return batch_results
+
     def reciprocal_rank_fusion(self, bm25_results: List[Dict], vector_results: List[Dict], top_k: int = 5, k: int = 60) -> List[Dict]:
         """倒数排名融合(RRF)"""
         rrf_scores = {}
 
         # 处理BM25结果
         for rank, result in enumerate(bm25_results):
-            doc_id = result["metadata"].get("id", result["metadata"].get("filepath", ""))
+            doc_id = result.get("id", result["metadata"].get("filepath", ""))
             if doc_id not in rrf_scores:
                 rrf_scores[doc_id] = {"doc": result, "score": 0}
             rrf_scores[doc_id]["score"] += 1 / (k + rank + 1)
 
         # 处理向量结果
         for rank, result in enumerate(vector_results):
-            doc_id = result["metadata"].get("id", result["metadata"].get("filepath", ""))
+            doc_id = result.get("id", result["metadata"].get("filepath", ""))
             if doc_id not in rrf_scores:
                 rrf_scores[doc_id] = {"doc": result, "score": 0}
             rrf_scores[doc_id]["score"] += 1 / (k + rank + 1)
@@ -94,4 +173,17 @@ class HybridRetrieval:
         # 使用RRF融合结果
         fused_results = self.reciprocal_rank_fusion(bm25_results, vector_results, top_k=top_k)
 
-        return fused_results
\ No newline at end of file
+        return fused_results
+
+    def search_batch(self, queries: List[str], top_k: int = 5) -> List[List[Dict]]:
+        """批量混合检索，返回列表与queries一一对应"""
+        if not self.bm25:
+            return self.vector_search_batch(queries, top_k=top_k)
+
+        bm25_batch = self.bm25_search_batch(queries, top_k=top_k*2)
+        vector_batch = self.vector_search_batch(queries, top_k=top_k*2)
+
+        return [
+            self.reciprocal_rank_fusion(bm25_results, vector_results, top_k=top_k)
+            for bm25_results, vector_results in zip(bm25_batch, vector_batch)
+        ]
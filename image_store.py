@@ -0,0 +1,106 @@
+import base64
+import hashlib
+import io
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from config import (
+    IMAGE_STORE_DIR,
+    IMAGE_MIN_BYTES,
+    IMAGE_MAX_SIDE,
+    IMAGE_JPEG_QUALITY,
+)
+from startup_profile import timed_import
+
+# 图片引用：内容的sha256加扩展名
+_REF_PATTERN = re.compile(r"^[0-9a-f]{64}\.[0-9a-z]+$")
+
+
+class ImageStore:
+    """按内容寻址的图片存储
+
+    图片字节以sha256命名写入磁盘（按前两位分目录），文档块只保存引用（摘要+扩展名）；
+    相同的图片（如每页重复的校徽）只存一份。读取时才按需加载，并缩放、重新压缩后编码为data URL
+    """
+
+    def __init__(self, root: str = IMAGE_STORE_DIR):
+        self.root = root
+
+    def path(self, ref: str) -> str:
+        return os.path.join(self.root, ref[:2], ref)
+
+    def put(self, data: bytes, ext: str) -> Optional[str]:
+        """写入图片并返回引用；过小的图片（图标、装饰线条等）不保存，返回None"""
+        if len(data) < IMAGE_MIN_BYTES:
+            return None
+        ext = (ext or "bin").lower().lstrip(".")
+        ref = f"{hashlib.sha256(data).hexdigest()}.{ext}"
+        path = self.path(ref)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return ref
+
+    def restore(self, ref: str, data: bytes) -> bool:
+        """按引用写回图片（如从快照导入），内容与引用中的sha256不符时不写入并返回False"""
+        if not _REF_PATTERN.match(ref) or hashlib.sha256(data).hexdigest() != ref.split(".", 1)[0]:
+            return False
+        path = self.path(ref)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return True
+
+    def load_data_url(
+        self, ref: str, max_side: int = IMAGE_MAX_SIDE, quality: int = IMAGE_JPEG_QUALITY
+    ) -> Optional[str]:
+        """把图片缩放到最长边不超过max_side、重新压缩为JPEG后编码为data URL，图片不存在或无法解码时返回None"""
+        path = self.path(ref)
+        if not os.path.exists(path):
+            return None
+        try:
+            return _encode_image(path, max_side, quality)
+        except Exception as e:
+            print(f"图片无法解码，已跳过: {ref}（{e}）")
+            return None
+
+
+@lru_cache(maxsize=32)
+def _encode_image(path: str, max_side: int, quality: int) -> str:
+    # 同一张图常被连续几轮问答引用，缓存编码结果；内容寻址的文件不会被改写，无需失效
+    Image = timed_import("PIL.Image")
+    with Image.open(path) as image:
+        image.thumbnail((max_side, max_side))
+        if image.mode in ("RGBA", "LA", "P"):
+            # 示意图多为透明背景，铺白底后再转为JPEG
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[-1])
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def image_refs(metadata: Dict) -> List[str]:
+    """从文档块元数据中取出图片引用（Chroma元数据不支持列表，以JSON字符串保存）"""
+    images = (metadata or {}).get("images")
+    if not images:
+        return []
+    if isinstance(images, str):
+        try:
+            images = json.loads(images)
+        except ValueError:
+            return []
+    return [ref for ref in images if isinstance(ref, str)]
@@ -0,0 +1,196 @@
+"""可断点续传的知识库入库流程
+
+逐个文件解析并切分，每个文件完成后把文档块写入检查点目录；全部文件处理完后统一去重，
+再按批次请求embedding并写入collection，每批完成即提交。文档块id由来源与内容决定，
+中断后重新运行时已写入的批次会被识别出来，不再重复请求embedding。
+
+单个文件解析失败只记录并跳过，不影响其他文件；该文件在collection中原有的文档块予以保留。
+整个流程不会预先清空collection，只在全部批次写入后删除已不存在的旧文档块。
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+from typing import Dict, List, Optional
+
+from tqdm import tqdm
+
+from config import CHUNK_SIZE, CHUNK_OVERLAP, ENABLE_DEDUP, INGEST_BATCH_SIZE
+from vector_store import VectorStore
+
+CHECKPOINT_VERSION = 1
+
+
+def chunk_key(chunk: Dict) -> str:
+    """由来源位置与内容决定的文档块id，同一文档块在每次运行中id相同"""
+    key = "\0".join(
+        str(chunk.get(field, "")) for field in ("filepath", "page_number", "chunk_id", "content")
+    )
+    return "chunk_" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:24]
+
+
+class IngestionCheckpoint:
+    """入库检查点：记录每个文件的处理状态，并缓存已解析文件切分后的文档块"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.state_path = os.path.join(directory, "state.json")
+        self.files: Dict[str, Dict] = {}
+
+    def load(self) -> bool:
+        """读取已有的检查点，不存在或版本不符时返回False"""
+        if not os.path.exists(self.state_path):
+            return False
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("version") != CHECKPOINT_VERSION:
+            return False
+        self.files = state["files"]
+        return True
+
+    def reset(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.files = {}
+
+    def save(self) -> None:
+        """先写临时文件再替换，中断时不会留下写了一半的状态"""
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": CHECKPOINT_VERSION, "files": self.files}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    @staticmethod
+    def signature(file_path: str) -> Dict:
+        stat = os.stat(file_path)
+        return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+    def _chunks_path(self, file_path: str) -> str:
+        name = hashlib.sha1(file_path.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.directory, f"{name}.jsonl.gz")
+
+    def status(self, file_path: str) -> Optional[str]:
+        """文件未改动时返回上次记录的状态（"done" / "failed"），否则返回None"""
+        entry = self.files.get(file_path)
+        if entry is None or entry["signature"] != self.signature(file_path):
+            return None
+        if entry["status"] == "done" and not os.path.exists(self._chunks_path(file_path)):
+            return None
+        return entry["status"]
+
+    def mark_done(self, file_path: str, chunks: List[Dict]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        chunks_path = self._chunks_path(file_path)
+        with gzip.open(chunks_path + ".tmp", "wt", encoding="utf-8") as f:
+            for chunk in chunks:
+                f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+        os.replace(chunks_path + ".tmp", chunks_path)
+        self.files[file_path] = {
+            "signature": self.signature(file_path),
+            "status": "done",
+            "chunks": len(chunks),
+        }
+        self.save()
+
+    def mark_failed(self, file_path: str, error: str) -> None:
+        self.files[file_path] = {
+            "signature": self.signature(file_path),
+            "status": "failed",
+            "error": error,
+        }
+        self.save()
+
+    def load_chunks(self, file_path: str) -> List[Dict]:
+        with gzip.open(self._chunks_path(file_path), "rt", encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+
+def ingest(
+    vector_store: VectorStore,
+    loader,
+    splitter=None,
+    resume: bool = False,
+    retry_failed: bool = False,
+    batch_size: int = INGEST_BATCH_SIZE,
+) -> Dict:
+    """把loader数据目录下的文档写入vector_store，返回本次运行的统计
+
+    resume为True时沿用上次的检查点：已解析的文件直接读取缓存的文档块，
+    上次失败的文件默认跳过（retry_failed为True时重试）
+    """
+    # 文档解析与去重只在入库时才需要
+    from text_splitter import TextSplitter
+    from dedup import ChunkDeduplicator
+
+    splitter = splitter or TextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    checkpoint = IngestionCheckpoint(
+        os.path.join(vector_store.db_path, f"{vector_store.collection_name}.ingest")
+    )
+    if not (resume and checkpoint.load()):
+        checkpoint.reset()
+
+    stats = {"files": 0, "parsed": 0, "cached": 0, "failed": [], "chunks": 0, "embedded": 0, "deleted": 0}
+    chunks = []
+    for file_path in loader.list_files():
+        stats["files"] += 1
+        status = checkpoint.status(file_path) if resume else None
+        if status == "done":
+            chunks.extend(checkpoint.load_chunks(file_path))
+            stats["cached"] += 1
+            continue
+        if status == "failed" and not retry_failed:
+            print(f"跳过上次失败的文件: {file_path}（{checkpoint.files[file_path]['error']}）")
+            stats["failed"].append(file_path)
+            continue
+
+        print(f"正在加载: {file_path}")
+        try:
+            file_chunks = splitter.split_documents(loader.load_document(file_path))
+        except Exception as e:
+            print(f"加载失败，已跳过: {file_path}（{e}）")
+            checkpoint.mark_failed(file_path, f"{type(e).__name__}: {e}")
+            stats["failed"].append(file_path)
+            continue
+        checkpoint.mark_done(file_path, file_chunks)
+        chunks.extend(file_chunks)
+        stats["parsed"] += 1
+
+    # 去重依赖全部文档块，放在所有文件解析完成之后；结果是确定的，续传时得到相同的id
+    if ENABLE_DEDUP and chunks:
+        chunks = ChunkDeduplicator().deduplicate(chunks)
+
+    if not chunks:
+        # 没有解析出任何文档块（如数据目录为空）时不改动collection，避免误删整个知识库
+        print("未解析出任何文档块，向量数据库保持不变")
+        return stats
+
+    ids = [chunk_key(chunk) for chunk in chunks]
+    stats["chunks"] = len(chunks)
+    with tqdm(total=len(chunks), desc="写入向量数据库", unit="块") as progress:
+        for start in range(0, len(chunks), batch_size):
+            stats["embedded"] += vector_store.upsert_chunks(
+                ids[start:start + batch_size], chunks[start:start + batch_size]
+            )
+            progress.update(len(ids[start:start + batch_size]))
+
+    # 删除本次未生成的旧文档块；失败文件的旧文档块保留，等下次成功解析后再替换
+    live = set(ids)
+    failed = set(stats["failed"])
+    stale = [
+        doc["id"]
+        for doc in vector_store.iter_documents(include=("metadatas",))
+        if doc["id"] not in live and (doc["metadata"] or {}).get("filepath") not in failed
+    ]
+    for start in range(0, len(stale), batch_size):
+        vector_store.collection.delete(ids=stale[start:start + batch_size])
+    stats["deleted"] = len(stale)
+
+    print(
+        f"\n入库完成：{stats['files']} 个文件（解析 {stats['parsed']}，沿用检查点 {stats['cached']}，"
+        f"失败 {len(stats['failed'])}），共 {stats['chunks']} 个文档块，"
+        f"新请求embedding {stats['embedded']} 个，删除旧文档块 {stats['deleted']} 个"
+    )
+    for file_path in stats["failed"]:
+        print(f"  失败: {file_path}（{checkpoint.files[file_path]['error']}）")
+    return stats
@@ -1,7 +1,10 @@
 import os
-from rag_agent import RAGAgent
+from startup_profile import profiler
 
-from config import VECTOR_DB_PATH, MODEL_NAME
+with profiler.step("import rag_agent"):
+    from rag_agent import RAGAgent
+
+from config import VECTOR_DB_PATH, MODEL_NAME, STARTUP_PROFILE, STARTUP_TARGET_MAIN
 
 
 def main():
@@ -10,13 +13,23 @@ def main():
         return
 
     # 初始化RAG Agent
-    agent = RAGAgent(model=MODEL_NAME)
+    with profiler.step("初始化RAGAgent"):
+        agent = RAGAgent(model=MODEL_NAME)
 
     # 检查知识库
-    count = agent.vector_store.get_collection_count()
+    with profiler.step("读取知识库规模"):
+        try:
+            count = agent.vector_store.get_collection_count()
+        except ValueError:
+            # 默认课程尚未构建
+            return
     if count == 0:
         return
 
+    profiler.mark_ready()
+    if STARTUP_PROFILE:
+        print(profiler.report(target_seconds=STARTUP_TARGET_MAIN))
+
     agent.chat()
 
 
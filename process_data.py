@@ -1,12 +1,20 @@
+import argparse
 import os
 from document_loader import DocumentLoader
 from text_splitter import TextSplitter
 from vector_store import VectorStore
+from ingestion import ingest
 
 from config import DATA_DIR, CHUNK_SIZE, CHUNK_OVERLAP, VECTOR_DB_PATH
 
 
 def main():
+    parser = argparse.ArgumentParser(description="解析数据目录下的文档并写入向量数据库")
+    parser.add_argument("--resume", action="store_true", help="从上次中断处继续，已完成的文件与批次不再重复处理")
+    parser.add_argument("--retry-failed", action="store_true", help="配合--resume使用，重试上次解析失败的文件")
+    parser.add_argument("--recreate", action="store_true", help="入库前按当前HNSW配置重建collection的索引")
+    args = parser.parse_args()
+
     if not os.path.exists(DATA_DIR):
         print(f"数据目录不存在: {DATA_DIR}")
         print("请创建数据目录并放入PDF、PPTX、DOCX或TXT文件")
@@ -18,20 +26,24 @@ def main():
     )
     splitter = TextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
     vector_store = VectorStore(db_path=VECTOR_DB_PATH)
-    vector_store.clear_collection()
+    if args.recreate:
+        vector_store.recreate_collection()
+
+    # 逐文件解析切分、去重后分批写入向量数据库，每个文件与每批embedding完成即提交检查点
+    try:
+        stats = ingest(vector_store, loader, splitter, resume=args.resume, retry_failed=args.retry_failed)
+    except KeyboardInterrupt:
+        print("\n已中断，已完成的文件与批次已保存，可运行 python process_data.py --resume 继续")
+        return
+    except Exception as e:
+        print(f"\n入库中断: {e}")
+        print("已完成的文件与批次已保存，可运行 python process_data.py --resume 继续")
+        return
 
-    # 加载文档
-    documents = loader.load_all_documents()
-    if not documents:
+    if not stats["chunks"]:
         print("未找到任何文档")
         return
 
-    # 切分文档
-    chunks = splitter.split_documents(documents)
-
-    # 存储到向量数据库
-    vector_store.add_documents(chunks)
-    
     print("\n数据处理完成！可以运行main.py开始对话")
 
 
@@ -1,34 +1,84 @@
+import threading
+import time
 from typing import List, Dict, Optional, Tuple
 
-from openai import OpenAI
-
 from config import (
     OPENAI_API_KEY,
     OPENAI_API_BASE,
     MODEL_NAME,
     TOP_K,
+    ENABLE_WARMUP,
+    WARMUP_QUERY,
+    EXPAND_TO_PARENT,
+    PARENT_EXPAND_BUDGET,
+    COLLECTION_NAME,
+    COURSE_CACHE_MAX_BYTES,
+    ENABLE_RETRIEVAL_REUSE,
+    ENABLE_CONTEXT_COMPRESSION,
+    ENABLE_IMAGE_CONTEXT,
+    MULTIMODAL_MODEL_NAME,
+    MAX_CONTEXT_IMAGES,
 )
+from api_client import get_shared_client
+from context_compression import ContextCompressor
+from course_cache import CourseCache
+from followup import SessionRetrievalCache, merge_results
+from image_store import ImageStore, image_refs
+from startup_profile import timed_import
 from vector_store import VectorStore
 from hybrid_retrieval import HybridRetrieval
 
 
+class CourseState:
+    """一门课程已加载的检索状态"""
+
+    def __init__(self, vector_store: VectorStore, hybrid_retriever: Optional[HybridRetrieval] = None):
+        self.vector_store = vector_store
+        self.hybrid_retriever = hybrid_retriever
+
+    def memory_bytes(self) -> int:
+        # collection句柄本身很小，HNSW段由Chroma自行管理（见CHROMA_MEMORY_LIMIT_BYTES）
+        size = 64 * 1024
+        if self.hybrid_retriever is not None:
+            size += self.hybrid_retriever.memory_bytes()
+        return size
+
+
 class RAGAgent:
     def __init__(
         self,
         model: str = MODEL_NAME,
         use_hybrid_retrieval: bool = False,
+        warmup: bool = ENABLE_WARMUP,
+        compress_context: bool = ENABLE_CONTEXT_COMPRESSION,
+        course: str = COLLECTION_NAME,
+        course_cache_max_bytes: int = COURSE_CACHE_MAX_BYTES,
+        use_images: bool = ENABLE_IMAGE_CONTEXT,
     ):
         self.model = model
         self.use_hybrid_retrieval = use_hybrid_retrieval
+        self.compress_context = compress_context
+        self.use_images = use_images
+        self.image_store = ImageStore()
+        self.default_course = course
+
+        # 与VectorStore共享同一客户端，统一限流配额
+        self.client = get_shared_client(api_key=OPENAI_API_KEY, api_base=OPENAI_API_BASE)
+
+        # 各课程（collection）的检索状态按需加载，按LRU缓存
+        self.course_cache = CourseCache(
+            loader=self._load_course,
+            max_bytes=course_cache_max_bytes,
+            size_of=lambda state: state.memory_bytes(),
+        )
+        try:
+            self.get_course_state(course)
+        except ValueError as e:
+            # 默认课程尚未构建时仍可创建Agent（如界面中稍后重建知识库），使用时再报错
+            print(e)
 
-        self.client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_API_BASE)
-
-        self.vector_store = VectorStore()
-
-        # 初始化混合检索
-        if self.use_hybrid_retrieval:
-            self.hybrid_retriever = HybridRetrieval(self.vector_store)
-            self._build_hybrid_index()
+        # 按会话保存上一轮检索结果，供追问复用
+        self.session_retrievals = SessionRetrievalCache()
 
         """
         TODO: 实现并调整系统提示词，使其符合课程助教的角色和回答策略
@@ -42,32 +92,161 @@ Guidelines:
 4. Use clear and concise language suitable for students
 5. Maintain a helpful and professional tone"""
 
-    def _build_hybrid_index(self):
+        # 后台预热：加载索引、初始化jieba词典、建立API连接，降低首个问题的延迟
+        self.warmup_ready = threading.Event()
+        self.warmup_timings: Dict[str, float] = {}
+        self.warmup_error: Optional[str] = None
+        if warmup:
+            threading.Thread(target=self._warmup, name="rag-warmup", daemon=True).start()
+        else:
+            self.warmup_ready.set()
+
+    def _warmup(self) -> None:
+        """预热各组件，记录每一步耗时；出错只记录，不影响正常问答"""
+        steps = [
+            ("jieba词典", lambda: timed_import("jieba").initialize()),
+            ("向量索引", lambda: self.vector_store.collection.peek(limit=1)),
+            # 一次完整检索：建立到API的连接并让Chroma加载HNSW段（不做上下文压缩）
+            ("预热检索", lambda: self._retrieve_docs(WARMUP_QUERY, top_k=1)),
+        ]
+        try:
+            for name, step in steps:
+                start = time.perf_counter()
+                step()
+                self.warmup_timings[name] = time.perf_counter() - start
+        except Exception as e:
+            self.warmup_error = str(e)
+        finally:
+            self.warmup_ready.set()
+
+    def warmup_status(self) -> Dict:
+        """返回预热状态：是否就绪、各步骤耗时（秒）及错误信息"""
+        return {
+            "ready": self.warmup_ready.is_set(),
+            "timings": dict(self.warmup_timings),
+            "total": sum(self.warmup_timings.values()),
+            "error": self.warmup_error,
+        }
+
+    def format_warmup_status(self) -> str:
+        """预热状态的单行描述，供命令行与界面显示"""
+        status = self.warmup_status()
+        if not status["ready"]:
+            return "索引预热中..."
+        if status["error"]:
+            return f"索引预热失败: {status['error']}"
+        if not status["timings"]:
+            return "未启用索引预热"
+        detail = "，".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in status["timings"].items())
+        return f"索引已就绪，预热用时 {status['total'] * 1000:.0f} ms（{detail}）"
+
+    def _load_course(self, course: str) -> CourseState:
+        """加载一门课程：打开collection，启用混合检索时构建BM25索引"""
+        # 问答只打开已构建的课程，输错的课程名不会在数据库中留下空collection
+        vector_store = VectorStore(collection_name=course, create=False)
+        hybrid_retriever = None
+        if self.use_hybrid_retrieval:
+            hybrid_retriever = HybridRetrieval(vector_store)
+            self._build_hybrid_index(hybrid_retriever)
+        return CourseState(vector_store, hybrid_retriever)
+
+    def get_course_state(self, course: Optional[str] = None) -> CourseState:
+        """获取课程的检索状态，course为None时使用默认课程"""
+        return self.course_cache.get(course or self.default_course)
+
+    def invalidate_course(self, course: Optional[str] = None) -> None:
+        """课程知识库重建后丢弃其缓存状态，下次访问时重新加载"""
+        self.course_cache.invalidate(course or self.default_course)
+
+    def get_vector_store(self, course: Optional[str] = None) -> VectorStore:
+        return self.get_course_state(course).vector_store
+
+    @property
+    def vector_store(self) -> VectorStore:
+        """默认课程的VectorStore"""
+        return self.get_vector_store()
+
+    def course_stats(self) -> Dict[str, Dict[str, int]]:
+        """各课程缓存的命中、未命中、淘汰次数及占用字节数"""
+        return self.course_cache.stats()
+
+    def _build_hybrid_index(self, hybrid_retriever: HybridRetrieval):
         """构建混合检索索引"""
         try:
-            documents = self.vector_store.get_all_documents()
-            if documents:
-                self.hybrid_retriever.build_bm25_index(documents)
-        except Exception:
-            pass  # 静默失败，不影响原有功能
+            hybrid_retriever.build_bm25_index(hybrid_retriever.vector_store.iter_documents())
+        except Exception as e:
+            # 不影响向量检索，但需要让使用者知道混合检索未生效
+            print(f"构建BM25索引失败，混合检索将回退为向量检索: {str(e)}")
 
     def retrieve_context(
-        self, query: str, top_k: int = TOP_K
+        self, query: str, top_k: int = TOP_K, course: Optional[str] = None
     ) -> Tuple[str, List[Dict]]:
         """检索相关上下文
-        支持混合检索和向量检索
+        支持混合检索和向量检索；course指定本次请求的课程（collection），默认使用构造时的课程
         """
-        if self.use_hybrid_retrieval and hasattr(self, 'hybrid_retriever'):
-            retrieved_docs = self.hybrid_retriever.hybrid_search(query, top_k=top_k)
+        retrieved_docs, state = self._retrieve_docs(query, top_k=top_k, course=course)
+        return self._format_context(retrieved_docs, query, state), retrieved_docs
+
+    def _retrieve_docs(
+        self, query: str, top_k: int = TOP_K, course: Optional[str] = None
+    ) -> Tuple[List[Dict], CourseState]:
+        """检索并扩展到所在页，返回未经压缩和格式化的文档块及课程状态"""
+        state = self.get_course_state(course)
+        if state.hybrid_retriever is not None:
+            retrieved_docs = state.hybrid_retriever.hybrid_search(query, top_k=top_k)
         else:
-            retrieved_docs = self.vector_store.search(query, top_k=top_k)
-        
+            retrieved_docs = state.vector_store.search(query, top_k=top_k)
+
+        if EXPAND_TO_PARENT:
+            retrieved_docs = self._expand_to_parents(retrieved_docs, state.vector_store)
+
+        return retrieved_docs, state
+
+    def retrieve_for_session(
+        self, query: str, session_id: str, top_k: int = TOP_K, course: Optional[str] = None
+    ) -> Tuple[str, List[Dict]]:
+        """会话内检索：追问内容与上一轮高度重叠时复用上一轮结果，部分重叠时扩展，否则重新检索"""
+        course = course or self.default_course
+        decision, previous, tokens = self.session_retrievals.decide(session_id, query, course)
+
+        if decision == "reuse":
+            retrieved_docs = previous["docs"]
+        else:
+            retrieved_docs = self._retrieve_docs(query, top_k=top_k, course=course)[0]
+            if decision == "extend":
+                retrieved_docs = merge_results(retrieved_docs, previous["docs"], top_k)
+
+        self.session_retrievals.record(session_id, decision, course, tokens, retrieved_docs, previous)
+        return self._format_context(retrieved_docs, query, self.get_course_state(course)), retrieved_docs
+
+    def retrieval_metrics(self) -> Dict[str, int]:
+        """会话检索统计：重新检索、扩展、复用次数及省下的检索调用数"""
+        return self.session_retrievals.metrics()
+
+    def _format_context(
+        self, retrieved_docs: List[Dict], query: str, state: Optional[CourseState] = None
+    ) -> str:
+        """把检索结果格式化为带[来源 N]标注的上下文
+
+        启用上下文压缩时，每个文档块只保留与查询最相关的句子，来源标注保持不变
+        """
+        contents = [doc.get("content", "") for doc in retrieved_docs]
+        if self.compress_context and contents:
+            bm25_index = state.hybrid_retriever.bm25 if state and state.hybrid_retriever else None
+            compressed = ContextCompressor(bm25_index).compress_chunks(query, contents)
+            original_length = sum(len(content) for content in contents)
+            compressed_length = sum(len(content) for content in compressed)
+            print(
+                f"上下文压缩: {original_length} -> {compressed_length} 字符"
+                f"（压缩比 {compressed_length / max(original_length, 1):.2f}）"
+            )
+            contents = compressed
+
         context_parts = []
-        for idx, doc in enumerate(retrieved_docs, 1):
+        for idx, (doc, content) in enumerate(zip(retrieved_docs, contents), 1):
             metadata = doc.get("metadata", {})
             filename = metadata.get("filename", "unknown")
             page_number = metadata.get("page_number", 0)
-            content = doc.get("content", "")
             
             if page_number > 0:
                 source_info = f"[来源 {idx}]: {filename} 第 {page_number} 页"
@@ -76,14 +255,119 @@ Guidelines:
             
             context_parts.append(f"{source_info}\n{content}\n")
         
-        context = "\n".join(context_parts)
-        return context, retrieved_docs
+        return "\n".join(context_parts)
+
+    def _expand_to_parents(self, retrieved_docs: List[Dict], vector_store: VectorStore) -> List[Dict]:
+        """把命中的子块扩展为所在页的上下文（small-to-big）
+
+        同一页的多个命中合并为一条；整页不超过PARENT_EXPAND_BUDGET时使用整页，
+        否则从命中子块出发依次加入距离最近的相邻子块，直到达到预算
+        """
+        expanded = []
+        parent_hits = {}
+        for doc in retrieved_docs:
+            parent_id = doc.get("metadata", {}).get("parent_id")
+            if not parent_id:
+                expanded.append(doc)
+                continue
+            if parent_id not in parent_hits:
+                parent_hits[parent_id] = []
+                # 占位，保持该页首次命中时的排名
+                expanded.append(parent_id)
+            parent_hits[parent_id].append(doc)
+
+        for position, item in enumerate(expanded):
+            if not isinstance(item, str):
+                continue
+            hits = parent_hits[item]
+            try:
+                children = vector_store.get_parent_chunks(item)
+            except Exception:
+                children = []
+            expanded[position] = self._merge_children(hits, children)
+
+        return expanded
+
+    def _merge_children(self, hits: List[Dict], children: List[Dict]) -> Dict:
+        """在预算内选取子块并按页内位置拼接为一条上下文"""
+        best_hit = hits[0]
+        hit_ids = {hit.get("metadata", {}).get("chunk_id", 0) for hit in hits}
+        by_id = {child["metadata"].get("chunk_id", 0): child for child in children}
+        if not hit_ids.issubset(by_id):
+            return best_hit
+
+        page_length = sum(len(child["content"]) for child in children)
+        if page_length <= PARENT_EXPAND_BUDGET:
+            selected = set(by_id)
+        else:
+            selected = set(hit_ids)
+            used = sum(len(by_id[i]["content"]) for i in selected)
+            # 按与最近命中子块的距离由近到远扩展
+            candidates = sorted(
+                (i for i in by_id if i not in selected),
+                key=lambda i: min(abs(i - h) for h in hit_ids),
+            )
+            for i in candidates:
+                length = len(by_id[i]["content"])
+                if used + length > PARENT_EXPAND_BUDGET:
+                    break
+                selected.add(i)
+                used += length
+
+        # 相邻子块按起始位置去掉重叠部分，不连续处用省略号分隔
+        parts = []
+        text = ""
+        end = None
+        previous_id = None
+        for i in sorted(selected):
+            child = by_id[i]
+            start = child["metadata"].get("char_start", 0)
+            content = child["content"]
+            if previous_id is not None and i != previous_id + 1:
+                parts.append(text)
+                text, end = "", None
+            if end is not None and start < end:
+                content = content[end - start:]
+            text += content
+            end = max(end or 0, start + len(child["content"]))
+            previous_id = i
+        parts.append(text)
+
+        merged = dict(best_hit)
+        merged["content"] = "\n……\n".join(parts)
+        return merged
+
+    def collect_images(self, retrieved_docs: List[Dict], max_images: int = MAX_CONTEXT_IMAGES) -> List[Dict]:
+        """按检索排名为最终结果加载插图，返回 [{"url": data URL, "source": 来源说明}]
+
+        只有这里读取图片文件，且最多加载max_images张（缩放并重新压缩后编码），控制内存与请求体积
+        """
+        images = []
+        seen = set()
+        for idx, doc in enumerate(retrieved_docs, 1):
+            metadata = doc.get("metadata", {})
+            for ref in image_refs(metadata):
+                if len(images) >= max_images:
+                    return images
+                if ref in seen:
+                    continue
+                seen.add(ref)
+                url = self.image_store.load_data_url(ref)
+                if url is None:  # 图片缺失（如快照导出时已不存在）时只用文本回答
+                    continue
+                page_number = metadata.get("page_number", 0)
+                source = f"[来源 {idx}] {metadata.get('filename', 'unknown')}"
+                if page_number > 0:
+                    source += f" 第 {page_number} 页"
+                images.append({"url": url, "source": source})
+        return images
 
     def generate_response(
         self,
         query: str,
         context: str,
         chat_history: Optional[List[Dict]] = None,
+        images: Optional[List[Dict]] = None,
     ) -> str:
         """生成回答
         
@@ -91,6 +375,7 @@ Guidelines:
             query: 用户问题
             context: 检索到的上下文
             chat_history: 对话历史
+            images: collect_images返回的插图，提供时以多模态消息发送给MULTIMODAL_MODEL_NAME
         """
         messages = [{"role": "system", "content": self.system_prompt}]
 
@@ -114,19 +399,23 @@ Student Question: {query}
 
 Please provide a clear and accurate answer based on the course materials above."""
 
-        messages.append({"role": "user", "content": user_text})
-        
-        # 多模态接口示意（如需添加图片支持，可参考以下格式）：
-        # content_parts = [{"type": "text", "text": user_text}]
-        # content_parts.append({
-        #     "type": "image_url",
-        #     "image_url": {"url": f"data:image/png;base64,{base64_image}"}
-        # })
-        # messages.append({"role": "user", "content": content_parts})
+        model = self.model
+        if images:
+            figure_list = "\n".join(f"Figure {i}: {image['source']}" for i, image in enumerate(images, 1))
+            content_parts = [{
+                "type": "text",
+                "text": f"{user_text}\n\nThe following figures from the course materials are attached in order:\n{figure_list}",
+            }]
+            for image in images:
+                content_parts.append({"type": "image_url", "image_url": {"url": image["url"]}})
+            messages.append({"role": "user", "content": content_parts})
+            model = MULTIMODAL_MODEL_NAME
+        else:
+            messages.append({"role": "user", "content": user_text})
 
         try:
             response = self.client.chat.completions.create(
-                model=self.model, messages=messages, temperature=0.7, max_tokens=1500
+                model=model, messages=messages, temperature=0.7, max_tokens=1500
             )
 
             return response.choices[0].message.content
@@ -134,7 +423,12 @@ Please provide a clear and accurate answer based on the course materials above."
             return f"生成回答时出错: {str(e)}"
 
     def answer_question(
-        self, query: str, chat_history: Optional[List[Dict]] = None, top_k: int = TOP_K
+        self,
+        query: str,
+        chat_history: Optional[List[Dict]] = None,
+        top_k: int = TOP_K,
+        course: Optional[str] = None,
+        session_id: Optional[str] = None,
     ) -> Dict[str, any]:
         """回答问题
         
@@ -142,16 +436,24 @@ Please provide a clear and accurate answer based on the course materials above."
             query: 用户问题
             chat_history: 对话历史
             top_k: 检索文档数量
+            course: 课程（collection名称），默认使用构造时的课程
+            session_id: 会话标识，提供时追问可复用上一轮的检索结果
             
         返回:
             生成的回答
         """
-        context, retrieved_docs = self.retrieve_context(query, top_k=top_k)
+        if session_id is not None and ENABLE_RETRIEVAL_REUSE:
+            context, retrieved_docs = self.retrieve_for_session(
+                query, session_id, top_k=top_k, course=course
+            )
+        else:
+            context, retrieved_docs = self.retrieve_context(query, top_k=top_k, course=course)
 
         if not context:
             context = "（未检索到特别相关的课程材料）"
 
-        answer = self.generate_response(query, context, chat_history)
+        images = self.collect_images(retrieved_docs) if self.use_images else None
+        answer = self.generate_response(query, context, chat_history, images=images)
 
         return answer
 
@@ -159,18 +461,25 @@ Please provide a clear and accurate answer based on the course materials above."
         """交互式对话"""
         print("=" * 60)
         print("欢迎使用智能课程助教系统！")
+        print(self.format_warmup_status())
         print("=" * 60)
 
         chat_history = []
+        # 开场时若仍在预热，预热完成后在下一次输入前补充显示一次结果
+        warmup_reported = self.warmup_ready.is_set()
 
         while True:
             try:
+                if not warmup_reported and self.warmup_ready.is_set():
+                    print(f"\n{self.format_warmup_status()}")
+                    warmup_reported = True
+
                 query = input("\n学生: ").strip()
 
                 if not query:
                     continue
 
-                answer = self.answer_question(query, chat_history=chat_history)
+                answer = self.answer_question(query, chat_history=chat_history, session_id="cli")
 
                 print(f"\n助教: {answer}")
 
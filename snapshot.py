@@ -0,0 +1,296 @@
+"""知识库快照的导出与导入
+
+快照是单个带版本和校验和的文件，包含文档块、元数据、embedding（float32二进制数组）、
+BM25索引以及文档块引用的插图，导入时直接批量写入新的collection，无需重新解析文档或调用embedding API。
+
+文件布局：
+    MAGIC | 文档块(gzip JSON Lines) | embedding(float32小端) | BM25索引(npz) | 插图(tar) | 清单JSON | 清单长度(uint64) | MAGIC
+清单记录格式版本、collection信息、各段的偏移、长度与sha256，以及插图数量和导出时已缺失的插图数量。
+
+用法：
+    python snapshot.py export kb.snapshot
+    python snapshot.py import kb.snapshot [--collection NAME]
+"""
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import struct
+import tarfile
+import tempfile
+import time
+from typing import Dict
+
+import numpy as np
+from tqdm import tqdm
+
+from bm25_index import BM25Index, bm25_index_path
+from config import OPENAI_EMBEDDING_MODEL, DOCUMENT_PAGE_SIZE
+from image_store import ImageStore, image_refs
+from vector_store import VectorStore
+
+MAGIC = b"RAGSNAP1"
+SNAPSHOT_VERSION = 3
+# 版本2的快照不含插图段，仍可导入
+_SUPPORTED_VERSIONS = (2, 3)
+_SECTIONS = ("chunks", "embeddings", "bm25", "images")
+_COPY_BUFFER = 1 << 20
+
+
+def _copy_section(src_path: str, out, manifest: Dict, name: str) -> None:
+    """把临时文件追加到快照中，并记录偏移、长度与sha256"""
+    digest = hashlib.sha256()
+    offset = out.tell()
+    with open(src_path, "rb") as src:
+        while True:
+            block = src.read(_COPY_BUFFER)
+            if not block:
+                break
+            digest.update(block)
+            out.write(block)
+    manifest["sections"][name] = {
+        "offset": offset,
+        "length": out.tell() - offset,
+        "sha256": digest.hexdigest(),
+    }
+
+
+def export_snapshot(
+    vector_store: VectorStore, path: str, page_size: int = DOCUMENT_PAGE_SIZE, image_store: ImageStore = None
+) -> Dict:
+    """把collection导出为快照文件，返回清单
+
+    分页读取collection，文档块与embedding先分别流式写入临时文件，内存占用与语料规模无关
+    """
+    count = 0
+    dim = None
+    index = BM25Index()
+    image_store = image_store or ImageStore()
+    refs = set()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        chunks_path = os.path.join(tmp_dir, "chunks")
+        embeddings_path = os.path.join(tmp_dir, "embeddings")
+        bm25_path = os.path.join(tmp_dir, "bm25")
+        images_path = os.path.join(tmp_dir, "images")
+
+        with gzip.open(chunks_path, "wt", encoding="utf-8") as chunks_file, \
+                open(embeddings_path, "wb") as embeddings_file:
+            documents = vector_store.iter_documents(
+                page_size=page_size, include=("documents", "metadatas", "embeddings")
+            )
+            for doc in tqdm(documents, total=vector_store.get_collection_count(), desc="导出快照", unit="块"):
+                embedding = np.asarray(doc.pop("embedding"), dtype="<f4")
+                if dim is None:
+                    dim = int(embedding.shape[0])
+                elif embedding.shape[0] != dim:
+                    raise ValueError(f"embedding维度不一致: {doc['id']} 为 {embedding.shape[0]}，预期 {dim}")
+                embeddings_file.write(embedding.tobytes())
+                chunks_file.write(json.dumps(doc, ensure_ascii=False) + "\n")
+                index.add([doc])
+                refs.update(image_refs(doc["metadata"]))
+                count += 1
+
+        index.save(bm25_path)
+
+        # 插图本身已是压缩格式，tar不再压缩；导出时已不在存储中的插图记入清单
+        image_count = 0
+        with tarfile.open(images_path, "w") as images_file:
+            for ref in sorted(refs):
+                if os.path.exists(image_store.path(ref)):
+                    images_file.add(image_store.path(ref), arcname=ref)
+                    image_count += 1
+
+        manifest = {
+            "version": SNAPSHOT_VERSION,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "collection_name": vector_store.collection_name,
+            "embedding_model": OPENAI_EMBEDDING_MODEL,
+            "count": count,
+            "dim": dim or 0,
+            "images": {"count": image_count, "missing": len(refs) - image_count},
+            "sections": {},
+        }
+        with open(path, "wb") as out:
+            out.write(MAGIC)
+            _copy_section(chunks_path, out, manifest, "chunks")
+            _copy_section(embeddings_path, out, manifest, "embeddings")
+            _copy_section(bm25_path, out, manifest, "bm25")
+            _copy_section(images_path, out, manifest, "images")
+            manifest_bytes = json.dumps(manifest, ensure_ascii=False).encode("utf-8")
+            out.write(manifest_bytes)
+            out.write(struct.pack("<Q", len(manifest_bytes)))
+            out.write(MAGIC)
+
+    print(
+        f"快照已导出: {path}（{count} 个块，维度 {dim}，插图 {image_count} 张，{os.path.getsize(path)} 字节）"
+    )
+    if len(refs) > image_count:
+        print(f"警告: {len(refs) - image_count} 张被引用的插图已不在图片存储中，未能导出")
+    return manifest
+
+
+def read_manifest(path: str) -> Dict:
+    """读取并校验快照清单（不校验各段内容）"""
+    tail = len(MAGIC) + 8
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"不是有效的知识库快照: {path}")
+        f.seek(-tail, os.SEEK_END)
+        manifest_length = struct.unpack("<Q", f.read(8))[0]
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"快照文件不完整: {path}")
+        f.seek(-(tail + manifest_length), os.SEEK_END)
+        manifest = json.loads(f.read(manifest_length).decode("utf-8"))
+
+    if manifest.get("version") not in _SUPPORTED_VERSIONS:
+        raise ValueError(f"不支持的快照版本: {manifest.get('version')}（当前支持 {_SUPPORTED_VERSIONS}）")
+    return manifest
+
+
+def _verify_sections(path: str, manifest: Dict) -> None:
+    with open(path, "rb") as f:
+        for name in _SECTIONS:
+            section = manifest["sections"].get(name)
+            if section is None:
+                if name == "images":
+                    continue
+                raise ValueError(f"快照缺少段 {name}")
+            f.seek(section["offset"])
+            digest = hashlib.sha256()
+            remaining = section["length"]
+            while remaining:
+                block = f.read(min(_COPY_BUFFER, remaining))
+                if not block:
+                    raise ValueError(f"快照段 {name} 被截断")
+                digest.update(block)
+                remaining -= len(block)
+            if digest.hexdigest() != section["sha256"]:
+                raise ValueError(f"快照段 {name} 校验失败，文件可能已损坏")
+
+
+class _SectionReader(io.RawIOBase):
+    """只读快照中一段的文件对象，读到段尾即返回EOF"""
+
+    def __init__(self, path: str, section: Dict):
+        self._file = open(path, "rb")
+        self._file.seek(section["offset"])
+        self._remaining = section["length"]
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self._remaining <= 0:
+            return 0
+        data = self._file.read(min(len(buffer), self._remaining))
+        buffer[:len(data)] = data
+        self._remaining -= len(data)
+        return len(data)
+
+    def close(self) -> None:
+        self._file.close()
+        super().close()
+
+
+def _open_section(path: str, section: Dict):
+    return io.BufferedReader(_SectionReader(path, section), _COPY_BUFFER)
+
+
+def import_snapshot(
+    path: str, collection_name: str = None, db_path: str = None, image_store: ImageStore = None
+) -> VectorStore:
+    """把快照批量导入到全新的collection（同名collection会被清空），插图写入图片存储，返回对应的VectorStore"""
+    manifest = read_manifest(path)
+    _verify_sections(path, manifest)
+
+    if manifest["embedding_model"] != OPENAI_EMBEDDING_MODEL:
+        print(
+            f"警告: 快照使用的embedding模型为 {manifest['embedding_model']}，"
+            f"与当前配置 {OPENAI_EMBEDDING_MODEL} 不一致，检索结果将不可靠"
+        )
+
+    kwargs = {"collection_name": collection_name or manifest["collection_name"]}
+    if db_path:
+        kwargs["db_path"] = db_path
+    vector_store = VectorStore(**kwargs)
+    vector_store.clear_collection()
+
+    sections = manifest["sections"]
+    dim = manifest["dim"]
+    batch_size = vector_store.chroma_client.get_max_batch_size()
+    row_bytes = dim * 4
+
+    with _open_section(path, sections["chunks"]) as raw_chunks, \
+            _open_section(path, sections["embeddings"]) as embeddings_file:
+        chunks_file = io.TextIOWrapper(gzip.GzipFile(fileobj=raw_chunks), encoding="utf-8")
+        progress = tqdm(total=manifest["count"], desc="导入快照", unit="块")
+        while True:
+            batch = []
+            for line in chunks_file:
+                batch.append(json.loads(line))
+                if len(batch) >= batch_size:
+                    break
+            if not batch:
+                break
+            embeddings = np.frombuffer(
+                embeddings_file.read(row_bytes * len(batch)), dtype="<f4"
+            ).reshape(len(batch), dim)
+            vector_store.collection.add(
+                ids=[doc["id"] for doc in batch],
+                documents=[doc["content"] for doc in batch],
+                metadatas=[doc["metadata"] or None for doc in batch],
+                embeddings=embeddings,
+            )
+            progress.update(len(batch))
+        progress.close()
+
+    # BM25索引放到向量数据库目录下，构建混合检索时复用其中的分词结果
+    with _open_section(path, sections["bm25"]) as src, \
+            open(bm25_index_path(vector_store.db_path, vector_store.collection_name), "wb") as dst:
+        shutil.copyfileobj(src, dst, _COPY_BUFFER)
+
+    if "images" in sections:
+        image_store = image_store or ImageStore()
+        restored = 0
+        with _open_section(path, sections["images"]) as src, tarfile.open(fileobj=src, mode="r|") as images_file:
+            for member in images_file:
+                if not member.isfile():
+                    continue
+                if image_store.restore(member.name, images_file.extractfile(member).read()):
+                    restored += 1
+                else:
+                    print(f"警告: 快照中的插图 {member.name} 校验失败，已跳过")
+        print(f"已导入插图 {restored} 张")
+        if manifest["images"]["missing"]:
+            print(f"注意: 导出时已有 {manifest['images']['missing']} 张插图缺失，相应文档块回答时不附带这些插图")
+    print(f"快照已导入到collection {vector_store.collection_name}，共 {vector_store.get_collection_count()} 个块")
+    return vector_store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="知识库快照导出/导入")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="导出当前collection为快照文件")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--collection", default=None, help="要导出的collection，默认使用配置中的名称")
+
+    import_parser = subparsers.add_parser("import", help="从快照文件导入到全新的collection")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--collection", default=None, help="目标collection，默认使用快照中记录的名称")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        kwargs = {"collection_name": args.collection} if args.collection else {}
+        vector_store = VectorStore(create=False, **kwargs)
+        export_snapshot(vector_store, args.path)
+    else:
+        import_snapshot(args.path, collection_name=args.collection)
+
+
+if __name__ == "__main__":
+    main()
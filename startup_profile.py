@@ -0,0 +1,59 @@
+import importlib
+import sys
+import time
+from contextlib import contextmanager
+from typing import List, Tuple
+
+# 以本模块首次被导入的时刻近似作为进程启动时刻，入口脚本应尽早导入本模块
+_START = time.perf_counter()
+
+
+class StartupProfiler:
+    """记录启动阶段各导入与初始化步骤的耗时，用于生成启动耗时报告"""
+
+    def __init__(self):
+        self.start = _START
+        self.steps: List[Tuple[str, float]] = []
+        self.ready_at = None
+
+    @contextmanager
+    def step(self, name: str):
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, time.perf_counter() - begin))
+
+    def mark_ready(self) -> float:
+        """标记已就绪（只记录第一次），返回从启动到就绪的秒数"""
+        if self.ready_at is None:
+            self.ready_at = time.perf_counter()
+        return self.ready_at - self.start
+
+    def report(self, target_seconds: float = None) -> str:
+        lines = ["启动耗时报告:"]
+        for name, seconds in self.steps:
+            lines.append(f"  {name:<32} {seconds * 1000:8.1f} ms")
+        if self.ready_at is not None:
+            total = self.ready_at - self.start
+            line = f"  {'就绪总耗时':<32} {total * 1000:8.1f} ms"
+            if target_seconds is not None:
+                status = "达标" if total <= target_seconds else "超出目标"
+                line += f"（目标 {target_seconds * 1000:.0f} ms，{status}）"
+            lines.append(line)
+        return "\n".join(lines)
+
+
+profiler = StartupProfiler()
+
+
+def timed_import(module_name: str):
+    """导入模块；首次导入时把耗时记入启动报告
+
+    重依赖（easyocr、PyPDF2、chromadb、jieba等）统一通过本函数延迟到真正用到时导入
+    """
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+    with profiler.step(f"import {module_name}"):
+        return importlib.import_module(module_name)
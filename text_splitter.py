@@ -1,11 +1,21 @@
-from typing import List, Dict
+from typing import List, Dict, Tuple
 from tqdm import tqdm
 
+from config import CHILD_CHUNK_SIZE, CHILD_CHUNK_OVERLAP
+
 
 class TextSplitter:
-    def __init__(self, chunk_size: int, chunk_overlap: int):
+    def __init__(
+        self,
+        chunk_size: int,
+        chunk_overlap: int,
+        child_chunk_size: int = CHILD_CHUNK_SIZE,
+        child_chunk_overlap: int = CHILD_CHUNK_OVERLAP,
+    ):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.child_chunk_size = child_chunk_size
+        self.child_chunk_overlap = child_chunk_overlap
 
     def split_text(self, text: str) -> List[str]:
         """将文本切分为块
@@ -17,6 +27,10 @@ class TextSplitter:
         3. 尽量在句子边界处切分（查找句子结束符：。！？.!?\n\n）
         4. 返回切分后的文本块列表
         """
+        return [chunk for _, chunk in self._split_with_offsets(text, self.chunk_size, self.chunk_overlap)]
+
+    def _split_with_offsets(self, text: str, chunk_size: int, chunk_overlap: int) -> List[Tuple[int, str]]:
+        """按句子边界切分文本，返回 (块在原文中的起始位置, 块内容) 列表"""
         if not text:
             return []
 
@@ -26,15 +40,15 @@ class TextSplitter:
         text_length = len(text)
 
         while start < text_length:
-            end = start + self.chunk_size
+            end = start + chunk_size
             
             if end >= text_length:
-                chunks.append(text[start:])
+                chunks.append((start, text[start:]))
                 break
             
             # Find sentence boundary
             boundary_pos = -1
-            search_start = max(start, end - self.chunk_size // 2)
+            search_start = max(start, end - chunk_size // 2)
             for i in range(end, search_start, -1):
                 if i < text_length:
                     # Check single character endings
@@ -51,16 +65,17 @@ class TextSplitter:
             
             chunk = text[start:boundary_pos]
             if chunk.strip():
-                chunks.append(chunk)
+                chunks.append((start, chunk))
             
             # Move start with overlap
-            start = max(start + 1, boundary_pos - self.chunk_overlap)
+            start = max(start + 1, boundary_pos - chunk_overlap)
 
         return chunks
 
     def split_documents(self, documents: List[Dict[str, str]]) -> List[Dict[str, str]]:
         """切分多个文档。
-        对于PDF和PPT，已经按页/幻灯片分割，不再进行二次切分
+        对于PDF和PPT，已经按页/幻灯片分割，每页再切分为较小的子块用于embedding和BM25，
+        子块通过parent_id关联所在页，并记录在页内的起始位置，检索时可据此还原整页或相邻子块
         对于DOCX和TXT，进行文本切分
         """
         chunks_with_metadata = []
@@ -70,16 +85,22 @@ class TextSplitter:
             filetype = doc.get("filetype", "")
 
             if filetype in [".pdf", ".pptx"]:
-                chunk_data = {
-                    "content": content,
-                    "filename": doc.get("filename", "unknown"),
-                    "filepath": doc.get("filepath", ""),
-                    "filetype": filetype,
-                    "page_number": doc.get("page_number", 0),
-                    "chunk_id": 0,
-                    "images": doc.get("images", []),
-                }
-                chunks_with_metadata.append(chunk_data)
+                page_number = doc.get("page_number", 0)
+                parent_id = f"{doc.get('filepath', '')}#{page_number}"
+                children = self._split_with_offsets(content, self.child_chunk_size, self.child_chunk_overlap)
+                for i, (char_start, chunk) in enumerate(children):
+                    chunk_data = {
+                        "content": chunk,
+                        "filename": doc.get("filename", "unknown"),
+                        "filepath": doc.get("filepath", ""),
+                        "filetype": filetype,
+                        "page_number": page_number,
+                        "chunk_id": i,
+                        "parent_id": parent_id,
+                        "char_start": char_start,
+                        "images": doc.get("images", []),
+                    }
+                    chunks_with_metadata.append(chunk_data)
 
             elif filetype in [".docx", ".txt"]:
                 chunks = self.split_text(content)
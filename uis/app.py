@@ -1,6 +1,9 @@
 import streamlit as st
 import json
-from utils import get_agent, rebuild_knowledge_base, generate_quiz
+import uuid
+from utils import get_agent, rebuild_knowledge_base, generate_quiz, invalidate_course
+from startup_profile import profiler
+from config import STARTUP_PROFILE, STARTUP_TARGET_APP, COLLECTION_NAME
 
 # 页面配置
 st.set_page_config(
@@ -14,6 +17,8 @@ with st.sidebar:
     st.title("控制面板")
 
     st.subheader("检索设置")
+    # 同一进程可服务多门课程，每门课程对应一个collection
+    course = st.text_input("课程（collection名称）", value=COLLECTION_NAME).strip() or COLLECTION_NAME
     use_hybrid = st.checkbox("启用混合检索", value=False,
                             help="结合BM25和向量检索提升准确率")
 
@@ -21,11 +26,11 @@ with st.sidebar:
     if st.button("重建知识库", type="primary"):
         with st.status("处理中...", expanded=True) as status:
             st.write("正在读取文档...")
-            success, msg = rebuild_knowledge_base()
+            success, msg = rebuild_knowledge_base(course)
             if success:
                 status.update(label="完成", state="complete", expanded=False)
                 st.success(msg)
-                st.cache_resource.clear()
+                invalidate_course(course)
             else:
                 status.update(label="失败", state="error")
                 st.error(msg)
@@ -37,6 +42,10 @@ with st.sidebar:
 st.title("🎓 智能课程助教系统")
 st.caption("基于RAG的课程问答助手")
 
+# 每个浏览器会话一个标识，用于追问时复用检索结果
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+
 # 初始化聊天历史
 if "messages" not in st.session_state:
     st.session_state.messages = [
@@ -55,7 +64,7 @@ with col1:
         with st.spinner("正在生成习题..."):
             try:
                 agent = get_agent(use_hybrid=use_hybrid)
-                quiz_content = generate_quiz(agent)
+                quiz_content = generate_quiz(agent, course=course)
 
                 # 尝试解析JSON
                 try:
@@ -103,7 +112,12 @@ if prompt := st.chat_input("请输入你的问题..."):
             agent = get_agent(use_hybrid=use_hybrid)
 
             with st.spinner("正在查阅资料..."):
-                response = agent.answer_question(prompt, chat_history=st.session_state.messages[:-1])
+                response = agent.answer_question(
+                    prompt,
+                    chat_history=st.session_state.messages[:-1],
+                    course=course,
+                    session_id=st.session_state.session_id,
+                )
 
             message_placeholder.markdown(response)
 
@@ -113,4 +127,32 @@ if prompt := st.chat_input("请输入你的问题..."):
             response = error_msg
 
     # 保存助手消息
-    st.session_state.messages.append({"role": "assistant", "content": response})
\ No newline at end of file
+    st.session_state.messages.append({"role": "assistant", "content": response})
+
+# 首次渲染完成即视为就绪
+profiler.mark_ready()
+
+# 页面渲染后再创建Agent，使后台预热与用户输入并行，不拖慢首屏
+with st.sidebar:
+    st.subheader("索引状态")
+    try:
+        agent = get_agent(use_hybrid=use_hybrid)
+        st.caption(agent.format_warmup_status())
+        with st.expander("课程缓存"):
+            for name, stats in agent.course_stats().items():
+                st.text(
+                    f"{name}: 命中 {stats['hits']}，未命中 {stats['misses']}，"
+                    f"淘汰 {stats['evictions']}，占用 {stats['bytes'] / 1024 / 1024:.1f} MB"
+                )
+        retrieval = agent.retrieval_metrics()
+        st.caption(
+            f"追问检索：重新检索 {retrieval['fresh']}，扩展 {retrieval['extended']}，"
+            f"复用 {retrieval['reused']}（省下 {retrieval['saved_retrievals']} 次检索）"
+        )
+    except Exception as e:
+        st.caption(f"初始化失败: {str(e)}")
+
+if STARTUP_PROFILE:
+    with st.sidebar:
+        with st.expander("启动耗时"):
+            st.text(profiler.report(target_seconds=STARTUP_TARGET_APP))
@@ -5,44 +5,65 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 import streamlit as st
-from rag_agent import RAGAgent
-from document_loader import DocumentLoader
+from startup_profile import profiler
+
+with profiler.step("import rag_agent"):
+    from rag_agent import RAGAgent
 from vector_store import VectorStore
+from config import CHUNK_SIZE, CHUNK_OVERLAP
+
+
+# 已创建的Agent（启用/不启用混合检索各一个），重建知识库后据此让各Agent丢弃该课程的缓存
+_agents = []
 
 
 @st.cache_resource
 def get_agent(use_hybrid: bool = False):
     """初始化并缓存RAG Agent"""
-    return RAGAgent(use_hybrid_retrieval=use_hybrid)
+    with profiler.step("初始化RAGAgent"):
+        agent = RAGAgent(use_hybrid_retrieval=use_hybrid)
+    _agents.append(agent)
+    return agent
+
 
+def invalidate_course(course=None):
+    """只丢弃被重建课程的缓存状态，其他课程已加载的索引保留"""
+    for agent in _agents:
+        agent.invalidate_course(course)
 
-def rebuild_knowledge_base():
-    """重建知识库"""
+
+def rebuild_knowledge_base(course=None):
+    """重建知识库，course为目标课程（collection名称），默认使用配置中的课程"""
     try:
-        vs = VectorStore()
-        vs.clear_collection()
+        # 文档解析（easyocr依赖torch）只在重建时才需要，不拖慢界面启动
+        from document_loader import DocumentLoader
+        from text_splitter import TextSplitter
+        from ingestion import ingest
 
-        loader = DocumentLoader()
-        documents = loader.load_all_documents()
+        vs = VectorStore(collection_name=course) if course else VectorStore()
 
-        if not documents:
-            return False, "未找到可加载的文档"
+        # 与process_data.py一致：PDF/PPT页切分为子块，DOCX/TXT按CHUNK_SIZE切分；
+        # 不预先清空collection，重建失败时原有知识库仍可用
+        stats = ingest(vs, DocumentLoader(), TextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP))
 
-        vs.add_documents(documents)
-        return True, f"成功重建知识库，共 {len(documents)} 个文档片段"
+        if not stats["chunks"]:
+            return False, "未找到可加载的文档"
+        if stats["failed"]:
+            return True, f"成功重建知识库，共 {stats['chunks']} 个文档片段，{len(stats['failed'])} 个文件加载失败已跳过"
+        return True, f"成功重建知识库，共 {stats['chunks']} 个文档片段"
     except Exception as e:
         return False, f"重建失败: {str(e)}"
 
 
-def generate_quiz(agent, topic="", difficulty="中等"):
+def generate_quiz(agent, topic="", difficulty="中等", course=None):
     """生成习题"""
     try:
         if not topic:
             # 随机从知识库中选择内容
-            context = get_weighted_random_content(agent)
+            context = get_weighted_random_content(agent, course=course)
         else:
             # 根据指定主题检索
-            context = agent.retrieve_context(topic, top_k=2)[0]
+            context = agent.retrieve_context(topic, top_k=2, course=course)[0]
 
         prompt = f"""根据以下课程内容，生成一道{difficulty}难度的单选题。
 
@@ -77,12 +98,14 @@ def generate_quiz(agent, topic="", difficulty="中等"):
         return f"生成习题失败: {str(e)}"
 
 
-def get_weighted_random_content(agent):
+def get_weighted_random_content(agent, course=None):
     """带权重的随机内容选择"""
-    all_docs = agent.vector_store.get_all_documents()
+    vector_store = agent.get_vector_store(course)
+    # 只读取元数据计算权重，选中后再按id取内容
+    all_docs = list(vector_store.iter_documents(include=("metadatas",)))
 
     if not all_docs:
-        return agent.retrieve_context("数学概念", top_k=1)[0]
+        return agent.retrieve_context("数学概念", top_k=1, course=course)[0]
 
     weights = []
     for doc in all_docs:
@@ -104,4 +127,4 @@ def get_weighted_random_content(agent):
     import random
     selected_doc = random.choices(all_docs, weights=weights, k=1)[0]
 
-    return selected_doc["content"]
\ No newline at end of file
+    return vector_store.get_documents_by_ids([selected_doc["id"]])[0]["content"]
\ No newline at end of file
@@ -1,20 +1,92 @@
+import json
 import os
-from typing import List, Dict
+import threading
+from typing import List, Dict, Iterator, Optional, Sequence
 
-import chromadb
-from chromadb.config import Settings
-from openai import OpenAI
 from tqdm import tqdm
 
+from api_client import get_shared_client
+from startup_profile import timed_import
+
 from config import (
     VECTOR_DB_PATH,
     COLLECTION_NAME,
     OPENAI_API_KEY,
     OPENAI_API_BASE,
     OPENAI_EMBEDDING_MODEL,
+    EMBEDDING_BATCH_SIZE,
+    DOCUMENT_PAGE_SIZE,
+    CHROMA_MEMORY_LIMIT_BYTES,
+    HNSW_SPACE,
+    HNSW_M,
+    HNSW_CONSTRUCTION_EF,
+    HNSW_SEARCH_EF,
     TOP_K,
 )
 
+_chroma_clients = {}
+_chroma_lock = threading.Lock()
+
+
+def _get_chroma_client(db_path: str):
+    """同一数据库目录在进程内共享一个PersistentClient，多个课程的VectorStore共用"""
+    key = os.path.abspath(db_path)
+    with _chroma_lock:
+        if key not in _chroma_clients:
+            os.makedirs(db_path, exist_ok=True)
+            chromadb = timed_import("chromadb")
+            settings_kwargs = {"anonymized_telemetry": False}
+            if CHROMA_MEMORY_LIMIT_BYTES:
+                # HNSW段按LRU常驻内存，超过上限时由Chroma卸载最久未用的collection
+                settings_kwargs["chroma_segment_cache_policy"] = "LRU"
+                settings_kwargs["chroma_memory_limit_bytes"] = CHROMA_MEMORY_LIMIT_BYTES
+            settings = timed_import("chromadb.config").Settings(**settings_kwargs)
+            _chroma_clients[key] = chromadb.PersistentClient(path=db_path, settings=settings)
+        return _chroma_clients[key]
+
+
+def collection_metadata(
+    description: str,
+    space: Optional[str] = None,
+    m: Optional[int] = None,
+    construction_ef: Optional[int] = None,
+    search_ef: Optional[int] = None,
+) -> Dict:
+    """新建collection时的元数据，HNSW参数使用各版本chromadb都支持的hnsw:*键，未指定的项取自配置
+
+    这些参数只在创建时生效，已存在的collection保持原有索引（见VectorStore.recreate_collection）
+    """
+    return {
+        "description": description,
+        "hnsw:space": space or HNSW_SPACE,
+        "hnsw:M": m or HNSW_M,
+        "hnsw:construction_ef": construction_ef or HNSW_CONSTRUCTION_EF,
+        "hnsw:search_ef": search_ef or HNSW_SEARCH_EF,
+    }
+
+
+def collection_hnsw_params(collection) -> Dict:
+    """collection实际使用的HNSW参数，取不到的项为None
+
+    新版chromadb从collection.configuration读取，旧版从元数据中的hnsw:*键读取
+    """
+    configuration = getattr(collection, "configuration", None) or {}
+    hnsw = configuration.get("hnsw") if isinstance(configuration, dict) else None
+    if hnsw:
+        return {
+            "space": hnsw.get("space"),
+            "m": hnsw.get("max_neighbors"),
+            "construction_ef": hnsw.get("ef_construction"),
+            "search_ef": hnsw.get("ef_search"),
+        }
+    metadata = collection.metadata or {}
+    return {
+        "space": metadata.get("hnsw:space"),
+        "m": metadata.get("hnsw:M"),
+        "construction_ef": metadata.get("hnsw:construction_ef"),
+        "search_ef": metadata.get("hnsw:search_ef"),
+    }
+
 
 class VectorStore:
 
@@ -24,23 +96,49 @@ class VectorStore:
         collection_name: str = COLLECTION_NAME,
         api_key: str = OPENAI_API_KEY,
         api_base: str = OPENAI_API_BASE,
+        create: bool = True,
     ):
+        """create为False时只打开已存在的collection（问答等服务路径），不存在时抛出ValueError；
+        只有入库流程才应创建collection"""
         self.db_path = db_path
         self.collection_name = collection_name
 
-        # 初始化OpenAI客户端
-        self.client = OpenAI(api_key=api_key, base_url=api_base)
+        # 初始化OpenAI客户端（进程内共享限流与重试）
+        self.client = get_shared_client(api_key=api_key, api_base=api_base)
 
         # 初始化ChromaDB
-        os.makedirs(db_path, exist_ok=True)
-        self.chroma_client = chromadb.PersistentClient(
-            path=db_path, settings=Settings(anonymized_telemetry=False)
-        )
+        self.chroma_client = _get_chroma_client(db_path)
 
         # 获取或创建collection
-        self.collection = self.chroma_client.get_or_create_collection(
-            name=collection_name, metadata={"description": "课程材料向量数据库"}
-        )
+        if create:
+            self.collection = self.chroma_client.get_or_create_collection(
+                name=collection_name, metadata=collection_metadata("课程材料向量数据库")
+            )
+        else:
+            if collection_name not in self.list_collections():
+                raise ValueError(f"未知课程: {collection_name}（向量数据库中没有该collection，请先构建知识库）")
+            self.collection = self.chroma_client.get_collection(name=collection_name)
+        self._check_hnsw_params()
+
+    def _check_hnsw_params(self) -> None:
+        """已有collection的HNSW参数不随配置改变，与配置不一致时提示用 --recreate 重建索引"""
+        expected = {
+            "space": HNSW_SPACE,
+            "m": HNSW_M,
+            "construction_ef": HNSW_CONSTRUCTION_EF,
+            "search_ef": HNSW_SEARCH_EF,
+        }
+        actual = collection_hnsw_params(self.collection)
+        differences = [
+            f"{key}={actual[key]}（配置为{value}）"
+            for key, value in expected.items()
+            if actual[key] is not None and actual[key] != value
+        ]
+        if differences:
+            print(
+                f"警告: collection {self.collection_name} 的HNSW参数与配置不一致：{'，'.join(differences)}；"
+                f"运行 python process_data.py --recreate 可按当前配置重建索引"
+            )
 
     def get_embedding(self, text: str) -> List[float]:
         """获取文本的向量表示
@@ -54,6 +152,22 @@ class VectorStore:
         )
         return response.data[0].embedding
 
+    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """批量获取文本的向量表示
+
+        每次请求最多发送EMBEDDING_BATCH_SIZE条文本，返回顺序与输入一致
+        """
+        embeddings = []
+        for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            batch = texts[start:start + EMBEDDING_BATCH_SIZE]
+            response = self.client.embeddings.create(
+                model=OPENAI_EMBEDDING_MODEL,
+                input=batch
+            )
+            data = sorted(response.data, key=lambda item: item.index)
+            embeddings.extend(item.embedding for item in data)
+        return embeddings
+
     def add_documents(self, chunks: List[Dict[str, str]]) -> None:
         """添加文档块到向量数据库
         TODO: 实现文档块添加到向量数据库
@@ -69,13 +183,7 @@ class VectorStore:
         
         for idx, chunk in enumerate(tqdm(chunks, desc="Adding documents", unit="chunk")):
             content = chunk.get("content", "")
-            metadata = {
-                "filename": chunk.get("filename", "unknown"),
-                "filepath": chunk.get("filepath", ""),
-                "filetype": chunk.get("filetype", ""),
-                "page_number": chunk.get("page_number", 0),
-                "chunk_id": chunk.get("chunk_id", 0),
-            }
+            metadata = self.chunk_metadata(chunk)
             
             texts.append(content)
             metadatas.append(metadata)
@@ -97,7 +205,64 @@ class VectorStore:
         
         print(f"\nSuccessfully added {len(chunks)} chunks to vector database")
 
-    def search(self, query: str, top_k: int = TOP_K) -> List[Dict]:
+    @staticmethod
+    def chunk_metadata(chunk: Dict) -> Dict:
+        """文档块写入Chroma时的元数据"""
+        metadata = {
+            "filename": chunk.get("filename", "unknown"),
+            "filepath": chunk.get("filepath", ""),
+            "filetype": chunk.get("filetype", ""),
+            "page_number": chunk.get("page_number", 0),
+            "chunk_id": chunk.get("chunk_id", 0),
+        }
+        # 去重后合并的块记录全部来源（Chroma元数据不支持列表，序列化为JSON）
+        if chunk.get("sources"):
+            metadata["sources"] = json.dumps(chunk["sources"], ensure_ascii=False)
+        # PDF/PPT子块关联所在页，用于检索后扩展上下文
+        if chunk.get("parent_id"):
+            metadata["parent_id"] = chunk["parent_id"]
+            metadata["char_start"] = chunk.get("char_start", 0)
+        # 插图只保存ImageStore中的引用，回答时再按需加载
+        if chunk.get("images"):
+            metadata["images"] = json.dumps(chunk["images"])
+        return metadata
+
+    def upsert_chunks(self, ids: List[str], chunks: List[Dict]) -> int:
+        """按给定id写入一批文档块，已存在的id只更新元数据，不重复请求embedding
+
+        返回新写入（调用了embedding）的文档块数量
+        """
+        existing = set(self.collection.get(ids=ids, include=[])["ids"])
+        if existing:
+            kept = [(doc_id, chunk) for doc_id, chunk in zip(ids, chunks) if doc_id in existing]
+            self.collection.update(
+                ids=[doc_id for doc_id, _ in kept],
+                metadatas=[self.chunk_metadata(chunk) for _, chunk in kept],
+            )
+
+        new = [(doc_id, chunk) for doc_id, chunk in zip(ids, chunks) if doc_id not in existing]
+        if new:
+            texts = [chunk.get("content", "") for _, chunk in new]
+            self.collection.add(
+                ids=[doc_id for doc_id, _ in new],
+                documents=texts,
+                metadatas=[self.chunk_metadata(chunk) for _, chunk in new],
+                embeddings=self.get_embeddings(texts),
+            )
+        return len(new)
+
+    def _resolve_collection(self, collection_name: Optional[str] = None):
+        """按请求指定的collection名称取collection，未指定时使用本实例的collection"""
+        if collection_name is None or collection_name == self.collection_name:
+            return self.collection
+        return self.chroma_client.get_collection(name=collection_name)
+
+    def list_collections(self) -> List[str]:
+        """数据库中所有collection（课程）的名称"""
+        # 不同版本的chromadb分别返回Collection对象或名称
+        return [getattr(c, "name", c) for c in self.chroma_client.list_collections()]
+
+    def search(self, query: str, top_k: int = TOP_K, collection_name: Optional[str] = None) -> List[Dict]:
         """搜索相关文档
 
         TODO: 实现向量相似度搜索
@@ -111,18 +276,43 @@ class VectorStore:
         """
         query_embedding = self.get_embedding(query)
         
-        results = self.collection.query(
+        results = self._resolve_collection(collection_name).query(
             query_embeddings=[query_embedding],
             n_results=top_k
         )
         
+        return self._format_query_results(results, 0)
+
+    def search_batch(
+        self, queries: List[str], top_k: int = TOP_K, collection_name: Optional[str] = None
+    ) -> List[List[Dict]]:
+        """批量搜索相关文档
+
+        所有查询的embedding在一次请求中获取，并通过一次collection.query完成检索，
+        返回列表与queries一一对应，每个元素的格式与search相同
+        """
+        if not queries:
+            return []
+
+        query_embeddings = self.get_embeddings(queries)
+
+        results = self._resolve_collection(collection_name).query(
+            query_embeddings=query_embeddings,
+            n_results=top_k
+        )
+
+        return [self._format_query_results(results, i) for i in range(len(queries))]
+
+    def _format_query_results(self, results: Dict, query_idx: int) -> List[Dict]:
+        """格式化collection.query中第query_idx个查询的结果"""
         formatted_results = []
-        if results['documents'] and len(results['documents'][0]) > 0:
-            for i in range(len(results['documents'][0])):
+        if results['documents'] and len(results['documents'][query_idx]) > 0:
+            for i in range(len(results['documents'][query_idx])):
                 formatted_results.append({
-                    "content": results['documents'][0][i],
-                    "metadata": results['metadatas'][0][i] if results['metadatas'] else {},
-                    "distance": results['distances'][0][i] if results['distances'] else None
+                    "id": results['ids'][query_idx][i],
+                    "content": results['documents'][query_idx][i],
+                    "metadata": results['metadatas'][query_idx][i] if results['metadatas'] else {},
+                    "distance": results['distances'][query_idx][i] if results['distances'] else None
                 })
         
         return formatted_results
@@ -131,25 +321,110 @@ class VectorStore:
         """清空collection"""
         self.chroma_client.delete_collection(name=self.collection_name)
         self.collection = self.chroma_client.create_collection(
-            name=self.collection_name, metadata={"description": "课程向量数据库"}
+            name=self.collection_name, metadata=collection_metadata("课程向量数据库")
         )
         print("向量数据库已清空")
 
+    def recreate_collection(self, page_size: int = DOCUMENT_PAGE_SIZE) -> None:
+        """按当前HNSW配置重建collection的索引
+
+        把全部文档块连同已存储的embedding复制到按当前配置新建的临时collection，
+        再删除原collection并把临时collection改回原名，不需要重新请求embedding
+        """
+        temp_name = f"{self.collection_name}_recreate"
+        if temp_name in self.list_collections():
+            self.chroma_client.delete_collection(name=temp_name)
+        target = self.chroma_client.create_collection(
+            name=temp_name, metadata=collection_metadata("课程材料向量数据库")
+        )
+
+        documents = self.iter_documents(page_size=page_size, include=("documents", "metadatas", "embeddings"))
+        batch = []
+        for doc in tqdm(documents, total=self.get_collection_count(), desc="重建HNSW索引", unit="块"):
+            batch.append(doc)
+            if len(batch) >= page_size:
+                self._copy_batch(target, batch)
+                batch = []
+        if batch:
+            self._copy_batch(target, batch)
+
+        self.chroma_client.delete_collection(name=self.collection_name)
+        target.modify(name=self.collection_name)
+        self.collection = self.chroma_client.get_collection(name=self.collection_name)
+        print(f"已按当前HNSW配置重建collection {self.collection_name}：{collection_hnsw_params(self.collection)}")
+
+    @staticmethod
+    def _copy_batch(target, batch: List[Dict]) -> None:
+        target.add(
+            ids=[doc["id"] for doc in batch],
+            documents=[doc["content"] for doc in batch],
+            metadatas=[doc["metadata"] or None for doc in batch],
+            embeddings=[doc["embedding"] for doc in batch],
+        )
+
     def get_collection_count(self) -> int:
         """获取collection中的文档数量"""
         return self.collection.count()
 
-    def get_all_documents(self) -> List[Dict]:
-        """获取所有文档用于构建BM25索引"""
-        try:
-            results = self.collection.get(include=["documents", "metadatas"])
-            documents = []
-            for i, doc in enumerate(results["documents"]):
-                documents.append({
-                    "id": results["ids"][i] if results["ids"] else f"doc_{i}",
-                    "content": doc,
-                    "metadata": results["metadatas"][i] if results["metadatas"] else {}
-                })
-            return documents
-        except Exception:
-            return []
+    def iter_documents(
+        self,
+        page_size: int = DOCUMENT_PAGE_SIZE,
+        include: Sequence[str] = ("documents", "metadatas"),
+    ) -> Iterator[Dict]:
+        """分页遍历collection中的文档
+
+        每次通过limit/offset只取page_size条，内存占用与collection大小无关。
+        include用于字段投影，如只需元数据时传入("metadatas",)，
+        返回的字典只包含id以及被请求的content/metadata/embedding字段。
+        读取出错时直接抛出异常，由调用方决定如何处理
+        """
+        include = list(include)
+        offset = 0
+        while True:
+            results = self.collection.get(limit=page_size, offset=offset, include=include)
+            ids = results["ids"]
+            if not ids:
+                break
+
+            for i, doc_id in enumerate(ids):
+                document = {"id": doc_id}
+                if "documents" in include:
+                    document["content"] = results["documents"][i]
+                if "metadatas" in include:
+                    document["metadata"] = results["metadatas"][i] or {}
+                if "embeddings" in include:
+                    document["embedding"] = results["embeddings"][i]
+                yield document
+
+            if len(ids) < page_size:
+                break
+            offset += page_size
+
+    def get_all_documents(self, page_size: int = DOCUMENT_PAGE_SIZE) -> List[Dict]:
+        """获取所有文档（内容与元数据）"""
+        return list(self.iter_documents(page_size=page_size))
+
+    def get_parent_chunks(self, parent_id: str) -> List[Dict]:
+        """获取同一页（parent_id相同）的全部子块，按chunk_id排序"""
+        results = self.collection.get(where={"parent_id": parent_id}, include=["documents", "metadatas"])
+        chunks = [
+            {
+                "id": doc_id,
+                "content": results["documents"][i],
+                "metadata": results["metadatas"][i] or {},
+            }
+            for i, doc_id in enumerate(results["ids"])
+        ]
+        return sorted(chunks, key=lambda chunk: chunk["metadata"].get("chunk_id", 0))
+
+    def get_documents_by_ids(self, ids: List[str]) -> List[Dict]:
+        """按id获取文档内容与元数据"""
+        results = self.collection.get(ids=ids, include=["documents", "metadatas"])
+        return [
+            {
+                "id": doc_id,
+                "content": results["documents"][i],
+                "metadata": results["metadatas"][i] or {},
+            }
+            for i, doc_id in enumerate(results["ids"])
+        ]